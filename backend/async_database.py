@@ -0,0 +1,346 @@
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import joinedload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import database as db
+from backend import metrics, pooling, querylog, search, sqlite_mode, startup
+from backend.database import (
+    EntityNotFoundException,
+    all_messages_query,
+    build_inbox_page,
+    build_message_page,
+    chat_stats_on_insert,
+    chat_version_query,
+    inbox_query,
+    membership_query,
+    message_page_query,
+    older_message_query,
+    page_tiers,
+    record_change,
+    unread_on_insert,
+)
+from backend.entities import (
+    ArchivedMessageInDB,
+    ChatChangeInDB,
+    ChatInDB,
+    Message,
+    MessageInDB,
+    MessageResponse,
+    NewMessage,
+    User,
+    UserChatLinkInDB,
+    UserInDB,
+)
+
+# async drivers for the sync urls built in database.py
+async_drivers = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+db_url = make_url(db.db_url)
+async_db_url = db_url.set(drivername=async_drivers[db_url.get_backend_name()])
+
+_async_engine = None
+_async_writer_engine = None
+_async_engine_lock = threading.Lock()
+
+
+def _build_async_engine(name: str, pool_options: dict):
+    async_engine = create_async_engine(async_db_url, **pool_options)
+    if db.concurrent_sqlite:
+        sqlite_mode.apply_pragmas(async_engine.sync_engine)
+    pooling.instrument(async_engine.sync_engine, name)
+    metrics.instrument(async_engine.sync_engine)
+    querylog.instrument(async_engine.sync_engine)
+    return async_engine
+
+
+def get_async_engine():
+    """Create the async engine (and import its driver) on first use."""
+    global _async_engine
+    if _async_engine is None:
+        with _async_engine_lock, startup.timed("create async engine"):
+            if _async_engine is None:
+                pooled = db_url.get_backend_name() == "postgresql" or db.concurrent_sqlite
+                _async_engine = _build_async_engine("async", pooling.pool_options(is_async=True) if pooled else {})
+    return _async_engine
+
+
+def get_async_writer_engine():
+    """The async counterpart of database.get_writer_engine."""
+    global _async_writer_engine
+    if _async_writer_engine is None and db.concurrent_sqlite:
+        with _async_engine_lock:
+            if _async_writer_engine is None:
+                _async_writer_engine = _build_async_engine(
+                    "async-writer", sqlite_mode.writer_pool_options(is_async=True)
+                )
+    return _async_writer_engine
+
+
+def __getattr__(name: str):
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def dispose_engine():
+    """Close pooled connections, if the engines were ever created."""
+    for engine in (_async_engine, _async_writer_engine):
+        if engine is not None:
+            await engine.dispose()
+
+
+async def get_session():
+    writer = get_async_writer_engine()
+    async with AsyncSession(
+        get_async_engine(),
+        sync_session_class=sqlite_mode.RoutingSession,
+        writer=writer.sync_engine if writer is not None else None,
+        expire_on_commit=False,
+    ) as session:
+        yield session
+
+
+async def get_chat_by_id(session: AsyncSession, chat_id: int) -> ChatInDB:
+    """
+    Retrieve a chat, with its owner, from the database.
+
+    :param chat_id: id of the chat to be retrieved
+    :return: the retrieved chat
+    :raises EntityNotFoundException: if no such chat id exists
+    """
+    chat = await session.get(
+        ChatInDB,
+        chat_id,
+        options=[joinedload(ChatInDB.owner)],
+    )
+    if chat:
+        return chat
+
+    raise EntityNotFoundException(entity_name="Chat", entity_id=chat_id)
+
+
+async def get_chat_version(session: AsyncSession, chat_id: int) -> tuple[int, int]:
+    """
+    Look up the version markers for a chat's conditional reads in one query.
+
+    :return: (chat version, users version)
+    :raises EntityNotFoundException: if no such chat id exists
+    """
+    row = (await session.exec(chat_version_query(chat_id))).first()
+    if row:
+        return tuple(row)
+
+    raise EntityNotFoundException(entity_name="Chat", entity_id=chat_id)
+
+
+async def is_chat_member(session: AsyncSession, chat_id: int, user_id: int) -> bool:
+    return (await session.exec(membership_query(chat_id, user_id))).one()
+
+
+async def get_chats_with_unread(session: AsyncSession, user_id: int) -> list[tuple[ChatInDB, int]]:
+    """
+    Retrieve a user's chats with their unread counts, read from the
+    membership links rather than by counting messages.
+
+    :return: [(chat with owner loaded, unread count)]
+    :raises EntityNotFoundException: if no such user id exists
+    """
+    user = await session.get(UserInDB, user_id)
+    if user:
+        result = await session.exec(
+            select(ChatInDB, UserChatLinkInDB.unread_count)
+            .join(UserChatLinkInDB)
+            .where(UserChatLinkInDB.user_id == user_id)
+            .options(joinedload(ChatInDB.owner))
+        )
+        return result.all()
+    raise EntityNotFoundException(entity_name="User", entity_id=user_id)
+
+
+async def get_inbox(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    before: Optional[str] = None,
+) -> tuple[list, Optional[str]]:
+    """
+    Retrieve one page of a user's chats, most recently active first.
+
+    :return: ([(chat, unread count, last activity, last message or None)], next_cursor)
+    """
+    rows = list((await session.exec(inbox_query(user_id, limit, before))).all())
+    return build_inbox_page(rows, limit)
+
+
+async def get_messages_in_chat(session: AsyncSession, chat_id: int) -> list[MessageInDB]:
+    await get_chat_by_id(session, chat_id)
+    messages = []
+    for model in (ArchivedMessageInDB, MessageInDB):
+        messages += (await session.exec(all_messages_query(chat_id, model))).all()
+    return messages
+
+
+async def get_message_page(
+    session: AsyncSession,
+    chat_id: int,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    at: Optional[datetime] = None,
+) -> tuple[list[MessageInDB], Optional[str], Optional[str]]:
+    """
+    Async version of database.get_message_page.
+
+    :return: (messages in ascending order, prev_cursor, next_cursor)
+    :raises EntityNotFoundException: if no such chat id exists
+    """
+    await get_chat_by_id(session, chat_id)
+
+    descending = after is None and at is None
+    rows = []
+    for model in page_tiers(descending):
+        if len(rows) > limit:
+            break
+        query, _ = message_page_query(chat_id, limit - len(rows), before, after, at, model)
+        rows += (await session.exec(query)).all()
+    has_older = None
+    if at is not None and rows:
+        has_older = False
+        for model in page_tiers(descending=True):
+            if (await session.exec(older_message_query(chat_id, at, model))).first() is not None:
+                has_older = True
+                break
+    return build_message_page(rows, limit, descending, before, after, has_older)
+
+
+async def add_message(
+    session: AsyncSession,
+    user: UserInDB,
+    chat_id: int,
+    new_message: NewMessage,
+) -> MessageResponse:
+    """
+    Add a message to a chat.
+
+    :param user: the author; may belong to another (sync) session
+    :return: the created message
+    :raises EntityNotFoundException: if no such chat id exists
+    """
+    chat = await get_chat_by_id(session, chat_id)
+    messageInDB = MessageInDB(
+        text=new_message.text,
+        user_id=user.id,
+        chat_id=chat.id,
+    )
+    session.add(messageInDB)
+    await session.flush()
+    version = (await session.exec(chat_stats_on_insert(chat.id, messageInDB.created_at))).scalar_one()
+    record_change(session, chat.id, messageInDB.id, "created", version)
+    await session.exec(unread_on_insert(chat.id, user.id, messageInDB.id))
+    await session.commit()
+    await session.refresh(messageInDB)
+    formattedUser = User(id=user.id, username=user.username, email=user.email, created_at=user.created_at)
+    message = Message(
+        id=messageInDB.id,
+        text=messageInDB.text,
+        chat_id=chat.id,
+        user=formattedUser,
+        created_at=messageInDB.created_at,
+    )
+    return MessageResponse(
+        message=message
+    )
+
+
+async def add_messages(
+    session: AsyncSession,
+    user: UserInDB,
+    chat_id: int,
+    new_messages: list[NewMessage],
+) -> list[tuple[int, datetime]]:
+    """
+    Add several messages from one author to a chat in a single transaction,
+    with one multi-row insert. The caller checks membership.
+
+    :param user: the author; may belong to another (sync) session
+    :return: (id, created_at) of each created message, in the order given
+    """
+    created_at = datetime.now()
+    result = await session.exec(
+        insert(MessageInDB)
+        .values([
+            {"text": new_message.text, "user_id": user.id, "chat_id": chat_id, "created_at": created_at}
+            for new_message in new_messages
+        ])
+        .returning(MessageInDB.id)
+    )
+    # one statement assigns ids in VALUES order, though RETURNING may list them in any order
+    message_ids = sorted(result.scalars().all())
+    version = (await session.exec(chat_stats_on_insert(chat_id, created_at, count=len(message_ids)))).scalar_one()
+    first_version = version - len(message_ids) + 1
+    await session.exec(
+        insert(ChatChangeInDB).values([
+            {
+                "chat_id": chat_id, "version": first_version + index, "message_id": message_id,
+                "kind": "created", "created_at": created_at,
+            }
+            for index, message_id in enumerate(message_ids)
+        ])
+    )
+    await session.exec(unread_on_insert(chat_id, user.id, message_ids[-1], count=len(message_ids)))
+    await session.commit()
+    return [(message_id, created_at) for message_id in message_ids]
+
+
+async def get_users_in_chat(session: AsyncSession, chat_id: int) -> list[UserInDB]:
+    await get_chat_by_id(session, chat_id)
+    result = await session.exec(
+        select(UserInDB)
+        .join(UserChatLinkInDB)
+        .where(UserChatLinkInDB.chat_id == chat_id)
+    )
+    return result.all()
+
+
+async def search_messages(
+    session: AsyncSession,
+    query: str,
+    limit: int,
+    offset: int,
+    chat_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> list[MessageInDB]:
+    """
+    Full-text search over hot and archived messages, best match first.
+
+    :param chat_id: search only this chat
+    :param user_id: search only chats this user is a member of
+    :return: up to limit matching messages, with authors loaded
+    """
+    if chat_id is not None:
+        chat_ids = chat_id
+    else:
+        chat_ids = select(UserChatLinkInDB.chat_id).where(UserChatLinkInDB.user_id == user_id)
+    statement = search.search_query(session.bind.dialect.name, query, chat_ids, limit, offset)
+    ids = (await session.exec(statement)).scalars().all()
+    messages = {}
+    for model in search.models:
+        missing = [message_id for message_id in ids if message_id not in messages]
+        if not missing:
+            break
+        result = await session.exec(
+            select(model).where(model.id.in_(missing)).options(joinedload(model.user))
+        )
+        messages.update((message.id, message) for message in result.all())
+    return [messages[message_id] for message_id in ids if message_id in messages]
+
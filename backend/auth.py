@@ -6,17 +6,18 @@ from fastapi.security import (
     OAuth2PasswordBearer,
     OAuth2PasswordRequestForm,
 )
-from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
+from jose import ExpiredSignatureError, JWTError
 from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import make_transient_to_detached
 from sqlmodel import Session, SQLModel, select
+from starlette.concurrency import run_in_threadpool
 
 from backend import database as db
+from backend.cache import user_cache
 from backend.entities import User, UserInDB, UserResponse
+from backend.passwords import password_hasher
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 jwt_key = os.environ.get("JWT_KEY", default="insecure-jwt-key-for-dev")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
@@ -86,72 +87,101 @@ class ExpiredToken(AuthException):
 
 
 @auth_router.post("/registration", response_model=UserResponse, status_code=201)
-def register_new_user(
+async def register_new_user(
     registration: UserRegistration,
     # session: Session = Depends(db.get_session),
     session: Annotated[Session, Depends(db.get_session)],
 ):
     """Register new user."""
 
-    hashed_password = pwd_context.hash(registration.password)
+    await run_in_threadpool(_check_registration_unique, session, registration)
+    hashed_password = await password_hasher.hash(registration.password)
     user = UserInDB(
         **registration.model_dump(),
         hashed_password=hashed_password,
     )
-    if(session.exec(select(UserInDB).where(UserInDB.email==user.email)).first()):
+    await run_in_threadpool(_save_user, session, user)
+    return UserResponse(user = user)
+
+
+def _check_registration_unique(session: Session, registration: UserRegistration):
+    if(session.exec(select(UserInDB).where(UserInDB.email==registration.email)).first()):
         raise HTTPException(
             status_code = 422,
             detail={
                 "type": "duplicate_value",
                 "entity_name": "User",
                 "entity_field": "email",
-                "entity_value": user.email,
+                "entity_value": registration.email,
             })
     
-    if(session.exec(select(UserInDB).where(UserInDB.username==user.username)).first()):
+    if(session.exec(select(UserInDB).where(UserInDB.username==registration.username)).first()):
         raise HTTPException(
             status_code = 422,
             detail={
                 "type": "duplicate_value",
                 "entity_name": "User",
                 "entity_field": "username",
-                "entity_value": user.username,
+                "entity_value": registration.username,
             })
-    
+
+
+def _save_user(session: Session, user: UserInDB):
+    session.add(user)
+    db.bump_version(session, "users")
+    session.commit()
+    session.refresh(user)
+
+
+def _save_password_hash(session: Session, user: UserInDB):
+    # the hash isn't in any public read, so ETags stay valid
     session.add(user)
     session.commit()
     session.refresh(user)
-    return UserResponse(user = user)
     
 
 
 @auth_router.post("/token", response_model=AccessToken)
-def get_access_token(
+async def get_access_token(
     form: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(db.get_session),
 ):
     """Get access token for user."""
 
-    user = _get_authenticated_user(session, form)
+    user = await _get_authenticated_user(session, form)
     return _build_access_token(user)
 
 
 
-def _get_authenticated_user(
+async def _get_authenticated_user(
     session: Session,
     form: OAuth2PasswordRequestForm,
 ) -> UserInDB:
-    user = session.exec(
-        select(UserInDB).where(UserInDB.username == form.username)
-    ).first()
+    user = await run_in_threadpool(
+        lambda: session.exec(
+            select(UserInDB).where(UserInDB.username == form.username)
+        ).first()
+    )
+
+    if user is None:
+        raise InvalidCredentials()
 
-    if user is None or not pwd_context.verify(form.password, user.hashed_password):
+    verified, new_hash = await password_hasher.verify_and_update(form.password, user.hashed_password)
+    if not verified:
         raise InvalidCredentials()
 
+    if new_hash is not None:
+        # cost factor changed since this hash was made; upgrade it transparently
+        user.hashed_password = new_hash
+        await run_in_threadpool(_save_password_hash, session, user)
+
     return user
 
 
 def _build_access_token(user: UserInDB) -> AccessToken:
+    # deferred: jose.jwt pulls in cryptography, which is slow to import
+    from jose import jwt
+
     expiration = int(datetime.now(timezone.utc).timestamp()) + access_token_duration
     claims = Claims(sub=str(user.id), exp=expiration)
     access_token = jwt.encode(claims.model_dump(), key=jwt_key, algorithm=jwt_alg)
@@ -172,16 +202,34 @@ def get_current_user(
     return user
 
 
+def get_user_from_token(session: Session, token: str) -> UserInDB:
+    """Resolve the user for a bearer token outside of HTTP dependencies (e.g. websockets)."""
+    return _decode_access_token(session, token)
+
+
 def _decode_access_token(session: Session, token: str) -> UserInDB:
+    from jose import jwt
+
     try:
         claims_dict = jwt.decode(token, key=jwt_key, algorithms=[jwt_alg])
         claims = Claims(**claims_dict)
         user_id = claims.sub
+
+        cache_key = (user_id, claims.exp)
+        cached = user_cache.get(cache_key)
+        if cached is not None:
+            # attach a copy to this session without a round trip
+            user = UserInDB(**cached)
+            make_transient_to_detached(user)
+            return session.merge(user, load=False)
+
         user = session.get(UserInDB, user_id)
 
         if user is None:
             raise InvalidToken()
 
+        ttl = claims.exp - datetime.now(timezone.utc).timestamp()
+        user_cache.set(cache_key, user.model_dump(), ttl=ttl)
         return user
     except ExpiredSignatureError:
         raise ExpiredToken()
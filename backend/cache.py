@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Hit and miss counters are kept so cache effectiveness can be checked
+    under load.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+# authenticated users, keyed by (user id, token exp)
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("AUTH_USER_CACHE_SIZE", default="1024")),
+    ttl=float(os.environ.get("AUTH_USER_CACHE_TTL", default="60")),
+)
+
+
+def invalidate_user(user_id: int):
+    """Drop every cached entry for a user, whatever token it came from."""
+    user_cache.discard_where(lambda key: key[0] == str(user_id))
+
+
+# chat memberships known to exist, keyed by (chat id, user id). Only positive
+# results are cached, so a new member is never refused; removals invalidate
+# their entry, and the short TTL bounds staleness across processes.
+membership_cache = TTLCache(
+    maxsize=int(os.environ.get("MEMBERSHIP_CACHE_SIZE", default="4096")),
+    ttl=float(os.environ.get("MEMBERSHIP_CACHE_TTL", default="30")),
+)
+
+
+def invalidate_membership(chat_id: int, user_id: Optional[int] = None):
+    """Drop cached memberships of one user, or of everyone, in a chat."""
+    if user_id is None:
+        membership_cache.discard_where(lambda key: key[0] == chat_id)
+    else:
+        membership_cache.discard((chat_id, user_id))
@@ -0,0 +1,36 @@
+import hashlib
+
+from fastapi import Request, Response
+
+# responses are per-user, and clients must revalidate before reusing them
+cache_control = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong ETag from the version markers and parameters a response
+    depends on, without rendering the response.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    """
+    Whether the request's If-None-Match lists this ETag, using weak comparison
+    as RFC 9110 requires. "*" is not honoured: the ETag is computed before we
+    know the resource exists.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=headers(etag))
+
+
+def headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": cache_control}
@@ -1,10 +1,18 @@
+import base64
+import functools
 import json
+import threading
 from datetime import datetime
+from typing import Optional
 from uuid import uuid4
 from fastapi.exceptions import HTTPException
 import os
+from sqlalchemy import case, delete, func, insert, inspect, text, tuple_, update
+from sqlalchemy.orm import joinedload
 from sqlmodel import Session, SQLModel, create_engine, select
 
+from backend import metrics, pooling, querylog, search, sqlite_mode, startup
+from backend.cache import invalidate_membership, invalidate_user
 from backend.entities import (
     UserChatLinkInDB,
     UserInDB,
@@ -15,13 +23,19 @@ from backend.entities import (
     ChatInDB,
     ChatUpdate,
     MessageInDB,
+    ArchivedMessageInDB,
+    ChatChangeInDB,
+    VersionInDB,
     NewMessage,
     MessageResponse,
     Message
 )
 
-with open("backend/fake_db.json", "r") as f:
-    DB = json.load(f)
+@functools.cache
+def get_fake_db() -> dict:
+    """Legacy JSON fixture data, parsed on first use rather than at import."""
+    with open("backend/fake_db.json", "r") as f:
+        return json.load(f)
 
 class EntityNotFoundException(Exception):
     def __init__(self, *, entity_name: str, entity_id: str):
@@ -52,7 +66,7 @@ def create_user(session: Session, user: UserCreate) -> UserInDB:
     :param user_create: attributes of the user to be created
     :return: the newly created user
     """
-    if user.id in DB["users"]:
+    if user.id in get_fake_db()["users"]:
         raise HTTPException(
             status_code = 422,
             detail={
@@ -74,6 +88,11 @@ def create_user(session: Session, user: UserCreate) -> UserInDB:
 
 
 
+def get_users_version(session: Session) -> int:
+    """Version of every user's public fields; changes on any registration or update."""
+    return session.exec(users_version_query()).one()
+
+
 def get_user_by_id(session: Session, user_id: int) -> UserInDB:
     """
     Retrieve a user from the database.
@@ -95,8 +114,10 @@ def update_user(session: Session, user: UserInDB, user_update: UserUpdate):
         setattr(user, attr, value)
     
     session.add(user)
+    bump_version(session, "users")
     session.commit()
     session.refresh(user)
+    invalidate_user(user.id)
     return user
 
 
@@ -108,16 +129,259 @@ def get_chats_with_user(session: Session, user_id: int) -> list[ChatInDB]:
     #if user_id in DB["users"]:
     user = session.get(UserInDB, user_id)
     if user:
-        return session.exec(select(ChatInDB).join(UserChatLinkInDB).where(UserChatLinkInDB.user_id == user_id)).all()
+        return session.exec(
+            select(ChatInDB)
+            .join(UserChatLinkInDB)
+            .where(UserChatLinkInDB.user_id == user_id)
+            .options(joinedload(ChatInDB.owner))
+        ).all()
     raise EntityNotFoundException(entity_name="User", entity_id=user_id)
     
 
-def get_messages_in_chat(session: Session, chat_id: int):
-    chat = session.get(ChatInDB, chat_id)
-    if chat:
-        return session.exec(select(MessageInDB).where(MessageInDB.chat_id == chat_id)).all()
-    raise EntityNotFoundException(entity_name="Chat", entity_id=chat_id)
+def all_messages_query(chat_id: int, model=MessageInDB):
+    """Build a query for every message of a chat in one tier, oldest first."""
+    return (
+        select(model)
+        .where(model.chat_id == chat_id)
+        .order_by(model.created_at, model.id)
+        .options(joinedload(model.user))
+    )
+
+
+def encode_cursor(message: MessageInDB) -> str:
+    """
+    Build an opaque pagination cursor pointing at a message.
+
+    :param message: the message the cursor points at
+    :return: url-safe cursor string
+    """
+    return encode_key_cursor(message.created_at, message.id)
+
+
+def encode_key_cursor(at: datetime, entity_id: int) -> str:
+    """Build an opaque pagination cursor from a (timestamp, id) sort key."""
+    raw = f"{at.isoformat()}|{entity_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a pagination cursor built by encode_cursor.
+
+    :param cursor: the cursor string
+    :return: (created_at, id) of the message the cursor points at
+    :raises HTTPException: if the cursor is malformed
+    """
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "type": "invalid_cursor",
+                "cursor": cursor,
+            })
+
+
+def get_message_page(
+    session: Session,
+    chat_id: int,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    at: Optional[datetime] = None,
+) -> tuple[list[MessageInDB], Optional[str], Optional[str]]:
+    """
+    Retrieve one page of messages in a chat using keyset pagination on
+    (created_at, id).
 
+    Without a cursor the newest messages are returned. Ordering and limiting
+    happen in SQL and are backed by the (chat_id, created_at, id) index.
+    Pages reaching past the hot table continue into archived_messages.
+
+    :param chat_id: id of the chat
+    :param limit: maximum number of messages to return
+    :param before: cursor; return messages strictly older than it
+    :param after: cursor; return messages strictly newer than it
+    :param at: return messages starting at this timestamp
+    :return: (messages in ascending order, prev_cursor, next_cursor)
+    :raises EntityNotFoundException: if no such chat id exists
+    """
+    get_chat_by_id(session, chat_id)
+
+    descending = after is None and at is None
+    rows = []
+    for model in page_tiers(descending):
+        if len(rows) > limit:
+            break
+        query, _ = message_page_query(chat_id, limit - len(rows), before, after, at, model)
+        rows += session.exec(query).all()
+    has_older = None
+    if at is not None and rows:
+        has_older = any(
+            session.exec(older_message_query(chat_id, at, model)).first() is not None
+            for model in page_tiers(descending=True)
+        )
+    return build_message_page(rows, limit, descending, before, after, has_older)
+
+
+def message_page_query(
+    chat_id: int,
+    limit: int,
+    before: Optional[str],
+    after: Optional[str],
+    at: Optional[datetime],
+    model=MessageInDB,
+):
+    """
+    Build the keyset query behind get_message_page.
+
+    :param model: MessageInDB or ArchivedMessageInDB
+    :return: (query fetching limit + 1 rows, whether it scans newest first)
+    """
+    key = tuple_(model.created_at, model.id)
+    query = (
+        select(model)
+        .where(model.chat_id == chat_id)
+        .options(joinedload(model.user))
+    )
+
+    if after is not None or at is not None:
+        if after is not None:
+            query = query.where(key > tuple_(*decode_cursor(after)))
+        else:
+            query = query.where(model.created_at >= at)
+        query = query.order_by(model.created_at, model.id)
+        descending = False
+    else:
+        if before is not None:
+            query = query.where(key < tuple_(*decode_cursor(before)))
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+        descending = True
+
+    return query.limit(limit + 1), descending
+
+
+def page_tiers(descending: bool) -> tuple:
+    """
+    The message tables in the order a page scans them.
+
+    Everything archived is older than everything still hot, so a page
+    scanning newest first only reaches the archive once the hot table runs
+    out, and one scanning oldest first drains the archive before the hot table.
+    """
+    if descending:
+        return (MessageInDB, ArchivedMessageInDB)
+    return (ArchivedMessageInDB, MessageInDB)
+
+
+def older_message_query(chat_id: int, at: datetime, model=MessageInDB):
+    """Build a query finding any message in a chat older than a timestamp."""
+    return (
+        select(model.id)
+        .where(model.chat_id == chat_id)
+        .where(model.created_at < at)
+        .limit(1)
+    )
+
+
+def build_message_page(
+    rows: list[MessageInDB],
+    limit: int,
+    descending: bool,
+    before: Optional[str],
+    after: Optional[str],
+    has_older: Optional[bool] = None,
+) -> tuple[list[MessageInDB], Optional[str], Optional[str]]:
+    """
+    Turn the rows fetched by message_page_query into a page with cursors.
+
+    :param has_older: whether older messages exist; only needed for "at" queries
+    :return: (messages in ascending order, prev_cursor, next_cursor)
+    """
+    has_more = len(rows) > limit
+    messages = rows[:limit]
+    if descending:
+        messages.reverse()
+
+    if not messages:
+        return messages, None, None
+
+    if descending:
+        has_older, has_newer = has_more, before is not None
+    elif after is not None:
+        has_older, has_newer = True, has_more
+    else:
+        has_newer = has_more
+
+    prev_cursor = encode_cursor(messages[0]) if has_older else None
+    next_cursor = encode_cursor(messages[-1]) if has_newer else None
+    return messages, prev_cursor, next_cursor
+
+
+def inbox_query(user_id: int, limit: int, before: Optional[str] = None):
+    """
+    Build the keyset query behind the inbox: a user's chats, most recently
+    active first, each with its unread count and latest message.
+
+    Membership comes from the user_chat_links primary key and the latest
+    message from the (chat_id, created_at, id) index, so this is one query
+    however many chats the user is in.
+
+    :param before: cursor from a previous page's next_cursor
+    :return: select of (ChatInDB, unread_count, activity, MessageInDB or None,
+        ArchivedMessageInDB or None) fetching limit + 1 rows; the archived
+        message is only looked up for chats with no hot messages
+    """
+    activity = func.coalesce(ChatInDB.last_message_at, ChatInDB.created_at).label("activity")
+
+    def last_message_id(model):
+        return (
+            select(model.id)
+            .where(model.chat_id == ChatInDB.id)
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(1)
+            .correlate(ChatInDB)
+            .scalar_subquery()
+        )
+
+    query = (
+        select(ChatInDB, UserChatLinkInDB.unread_count, activity, MessageInDB, ArchivedMessageInDB)
+        .join(UserChatLinkInDB, UserChatLinkInDB.chat_id == ChatInDB.id)
+        .outerjoin(MessageInDB, MessageInDB.id == last_message_id(MessageInDB))
+        .outerjoin(
+            ArchivedMessageInDB,
+            (MessageInDB.id == None)  # noqa: E711
+            & (ArchivedMessageInDB.id == last_message_id(ArchivedMessageInDB)),
+        )
+        .where(UserChatLinkInDB.user_id == user_id)
+        .options(
+            joinedload(ChatInDB.owner),
+            joinedload(MessageInDB.user),
+            joinedload(ArchivedMessageInDB.user),
+        )
+    )
+    if before is not None:
+        query = query.where(tuple_(activity, ChatInDB.id) < tuple_(*decode_cursor(before)))
+    return query.order_by(activity.desc(), ChatInDB.id.desc()).limit(limit + 1)
+
+
+def build_inbox_page(rows: list, limit: int) -> tuple[list, Optional[str]]:
+    """
+    Turn the rows fetched by inbox_query into a page.
+
+    :return: ([(chat, unread count, last activity, last message or None)], next_cursor)
+    """
+    entries = [
+        (chat, unread_count, activity, message or archived_message)
+        for chat, unread_count, activity, message, archived_message in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        chat, _unread_count, activity, _message = entries[-1]
+        next_cursor = encode_key_cursor(activity, chat.id)
+    return entries, next_cursor
 
 
 def add_message(session: Session, user: UserInDB, chat_id: int, new_message: NewMessage):
@@ -131,6 +395,10 @@ def add_message(session: Session, user: UserInDB, chat_id: int, new_message: New
             
         )
     session.add(messageInDB)
+    session.flush()
+    version = session.exec(chat_stats_on_insert(chat.id, messageInDB.created_at)).scalar_one()
+    record_change(session, chat.id, messageInDB.id, "created", version)
+    session.exec(unread_on_insert(chat.id, user.id, messageInDB.id))
     session.commit()
     session.refresh(messageInDB)
     formattedUser = User(id=user.id, username=user.username, email=user.email, created_at=user.created_at)
@@ -148,6 +416,351 @@ def add_message(session: Session, user: UserInDB, chat_id: int, new_message: New
 
 
 
+def record_change(session: Session, chat_id: int, message_id: int, kind: str, version: int):
+    """
+    Append an entry to a chat's change log in the caller's transaction.
+
+    :param chat_id: id of the chat the message belongs to
+    :param message_id: id of the changed message
+    :param kind: one of "created", "updated" or "deleted"
+    :param version: the chat's version returned by the update that bumped it
+        in this transaction, e.g. chat_stats_on_insert
+    """
+    session.add(ChatChangeInDB(chat_id=chat_id, message_id=message_id, kind=kind, version=version))
+
+
+def unread_on_insert(chat_id: int, author_id: int, message_id: int, count: int = 1):
+    """
+    Build the update that counts new messages as unread for every member
+    but their author, whose read marker moves to the last of them instead.
+
+    :param message_id: id of the newest of the inserted messages
+    :param count: how many messages were inserted
+    """
+    is_author = UserChatLinkInDB.user_id == author_id
+    return (
+        update(UserChatLinkInDB)
+        .where(UserChatLinkInDB.chat_id == chat_id)
+        .values(
+            unread_count=case((is_author, 0), else_=UserChatLinkInDB.unread_count + count),
+            last_read_message_id=case(
+                (is_author, message_id), else_=UserChatLinkInDB.last_read_message_id,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def unread_on_delete(chat_id: int, message_id: int):
+    """Build the update that uncounts a deleted message for members who hadn't read it."""
+    return (
+        update(UserChatLinkInDB)
+        .where(UserChatLinkInDB.chat_id == chat_id)
+        .where(UserChatLinkInDB.unread_count > 0)
+        .where(
+            (UserChatLinkInDB.last_read_message_id == None)  # noqa: E711
+            | (UserChatLinkInDB.last_read_message_id < message_id)
+        )
+        .values(unread_count=UserChatLinkInDB.unread_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def chat_stats_on_insert(chat_id: int, created_at: datetime, count: int = 1):
+    """
+    Build the update that counts new messages in their chat's statistics.
+
+    The version moves by one per message and the update returns the new
+    version; the messages' changes take the versions up to it.
+    """
+    return (
+        update(ChatInDB)
+        .where(ChatInDB.id == chat_id)
+        .values(
+            message_count=ChatInDB.message_count + count,
+            last_message_at=created_at,
+            version=ChatInDB.version + count,
+        )
+        .returning(ChatInDB.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _last_message_at(chat_id):
+    # index-backed: max over the (chat_id, created_at, id) indexes; the
+    # archive only matters once a chat has no hot messages left
+    return func.coalesce(*(
+        select(func.max(model.created_at))
+        .where(model.chat_id == chat_id)
+        .scalar_subquery()
+        for model in (MessageInDB, ArchivedMessageInDB)
+    ))
+
+
+def chat_stats_on_delete(chat_id: int):
+    """
+    Build the update that uncounts a deleted message and returns the chat's
+    new version; run after the delete is flushed.
+    """
+    return (
+        update(ChatInDB)
+        .where(ChatInDB.id == chat_id)
+        .values(
+            # a drifted counter stays at zero until repair_chat_stats fixes it
+            message_count=case((ChatInDB.message_count > 0, ChatInDB.message_count - 1), else_=0),
+            last_message_at=_last_message_at(chat_id),
+            version=ChatInDB.version + 1,
+        )
+        .returning(ChatInDB.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def chat_version_bump(chat_id: int):
+    """
+    Build the update marking a chat as changed, for writes that don't touch
+    its statistics. Returns the new version.
+    """
+    return (
+        update(ChatInDB)
+        .where(ChatInDB.id == chat_id)
+        .values(version=ChatInDB.version + 1)
+        .returning(ChatInDB.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_version(session: Session, name: str):
+    """Increment a named version counter in the caller's transaction."""
+    result = session.exec(
+        update(VersionInDB)
+        .where(VersionInDB.name == name)
+        .values(version=VersionInDB.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        session.add(VersionInDB(name=name, version=1))
+
+
+def _version(name: str):
+    return func.coalesce(
+        select(VersionInDB.version).where(VersionInDB.name == name).scalar_subquery(),
+        0,
+    )
+
+
+def users_version_query():
+    """Build a query for the version covering every user's public fields."""
+    return select(_version("users"))
+
+
+def chat_version_query(chat_id: int):
+    """
+    Build a single-row query for the versions a chat's conditional reads
+    depend on: the chat's own and the users version, since member names
+    appear in its reads. Returns no row if the chat doesn't exist.
+    """
+    return (
+        select(ChatInDB.version, _version("users"))
+        .where(ChatInDB.id == chat_id)
+    )
+
+
+def membership_query(chat_id: int, user_id: int):
+    """Build an EXISTS lookup on the user_chat_links primary key."""
+    return select(
+        select(UserChatLinkInDB.user_id)
+        .where(UserChatLinkInDB.user_id == user_id)
+        .where(UserChatLinkInDB.chat_id == chat_id)
+        .exists()
+    )
+
+
+def repair_chat_stats(session: Session) -> int:
+    """
+    Recompute message_count, member_count and last_message_at for every chat
+    in one set-based update. Chats whose statistics change get a new version,
+    so their cached reads are refetched.
+
+    :return: number of chats updated
+    """
+    message_count = sum(
+        select(func.count(model.id))
+        .where(model.chat_id == ChatInDB.id)
+        .scalar_subquery()
+        for model in (ArchivedMessageInDB, MessageInDB)
+    )
+    member_count = (
+        select(func.count(UserChatLinkInDB.user_id))
+        .where(UserChatLinkInDB.chat_id == ChatInDB.id)
+        .scalar_subquery()
+    )
+    last_message_at = _last_message_at(ChatInDB.id)
+    result = session.exec(
+        update(ChatInDB)
+        .where(
+            (ChatInDB.message_count != message_count)
+            | (ChatInDB.member_count != member_count)
+            | ChatInDB.last_message_at.is_distinct_from(last_message_at)
+        )
+        .values(
+            message_count=message_count,
+            member_count=member_count,
+            last_message_at=last_message_at,
+            version=ChatInDB.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def archive_messages(session: Session, before: datetime, batch_size: int) -> int:
+    """
+    Move messages created before a cutoff from messages to archived_messages,
+    one committed batch at a time. Chat statistics count both tables, so they
+    are unchanged.
+
+    :param before: messages older than this are archived
+    :param batch_size: messages moved per transaction
+    :return: number of messages archived
+    """
+    columns = ["id", "text", "user_id", "chat_id", "created_at"]
+    archived = 0
+    while True:
+        ids = session.exec(
+            select(MessageInDB.id)
+            .where(MessageInDB.created_at < before)
+            .order_by(MessageInDB.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            return archived
+        session.exec(
+            insert(ArchivedMessageInDB).from_select(
+                columns,
+                select(*(MessageInDB.__table__.c[column] for column in columns))
+                .where(MessageInDB.id.in_(ids)),
+            )
+        )
+        session.exec(
+            delete(MessageInDB)
+            .where(MessageInDB.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        archived += len(ids)
+
+
+def mark_chat_read(
+    session: Session,
+    user_id: int,
+    chat_id: int,
+    message_id: Optional[int] = None,
+) -> UserChatLinkInDB:
+    """
+    Move a member's read marker in a chat.
+
+    :param message_id: last message read; defaults to the newest message
+    :return: the updated membership link
+    :raises EntityNotFoundException: if the chat or message doesn't exist
+    """
+    link = session.get(UserChatLinkInDB, (user_id, chat_id))
+    if link is None:
+        raise EntityNotFoundException(entity_name="Chat", entity_id=chat_id)
+
+    tiers = (MessageInDB, ArchivedMessageInDB)
+    if message_id is None:
+        # the archive only holds the newest message once the hot table is empty
+        for model in tiers:
+            message_id = session.exec(
+                select(model.id)
+                .where(model.chat_id == chat_id)
+                .order_by(model.created_at.desc(), model.id.desc())
+                .limit(1)
+            ).first()
+            if message_id is not None:
+                break
+    else:
+        get_chat_message(session, chat_id, message_id)
+
+    unread_count = 0
+    if message_id is not None:
+        unread_count = sum(
+            session.exec(
+                select(func.count(model.id))
+                .where(model.chat_id == chat_id)
+                .where(model.id > message_id)
+            ).one()
+            for model in tiers
+        )
+
+    link.last_read_message_id = message_id
+    link.last_read_at = datetime.now()
+    link.unread_count = unread_count
+    session.add(link)
+    session.commit()
+    session.refresh(link)
+    return link
+
+
+def get_changes_since(
+    session: Session,
+    chat_id: int,
+    since: int,
+    limit: int,
+) -> tuple[list[tuple[ChatChangeInDB, Optional[MessageInDB]]], int, bool]:
+    """
+    Retrieve message changes in a chat after a version.
+
+    Several changes to the same message are collapsed into the latest one, so
+    the work done is proportional to the number of changed messages.
+
+    :param chat_id: id of the chat
+    :param since: version the client already has
+    :param limit: maximum number of change log entries to read
+    :return: ([(change, current message or None)], new version, has_more)
+    :raises EntityNotFoundException: if no such chat id exists
+    """
+    get_chat_by_id(session, chat_id)
+
+    changes = list(session.exec(
+        select(ChatChangeInDB)
+        .where(ChatChangeInDB.chat_id == chat_id)
+        .where(ChatChangeInDB.version > since)
+        .order_by(ChatChangeInDB.version)
+        .limit(limit + 1)
+    ).all())
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        return [], since, False
+
+    latest = {change.message_id: change for change in changes}
+    live_ids = [
+        message_id for message_id, change in latest.items() if change.kind != "deleted"
+    ]
+    messages = {}
+    for model in (MessageInDB, ArchivedMessageInDB):
+        missing = [message_id for message_id in live_ids if message_id not in messages]
+        if not missing:
+            break
+        messages.update(
+            (message.id, message)
+            for message in session.exec(
+                select(model)
+                .where(model.id.in_(missing))
+                .options(joinedload(model.user))
+            ).all()
+        )
+
+    deltas = [
+        (change, messages.get(change.message_id))
+        for change in sorted(latest.values(), key=lambda change: change.version)
+    ]
+    return deltas, changes[-1].version, has_more
+
+
 def get_users_in_chat(session: Session, chat_id:int) -> list[UserInDB]:
    
     chat = session.get(ChatInDB, chat_id)
@@ -183,6 +796,7 @@ def update_chat(session: Session, chat_id: int, chat_update: ChatUpdate ) -> Cha
 
     for attr, value in chat_update.model_dump(exclude_unset=True).items():
         setattr(chat, attr, value)
+    chat.version = ChatInDB.version + 1
 
     session.add(chat)
     session.commit()
@@ -199,6 +813,7 @@ def delete_chat(session: Session, chat_id: int):
     chat = get_chat_by_id(session, chat_id)
     session.delete(chat)
     session.commit()
+    invalidate_membership(chat_id)
 
 if os.environ.get("DB_LOCATION") == "RDS":
     username = os.environ.get("PG_USERNAME")
@@ -206,27 +821,163 @@ if os.environ.get("DB_LOCATION") == "RDS":
     endpoint = os.environ.get("PG_ENDPOINT")
     port = os.environ.get("PG_PORT")
     db_url = f"postgresql://{username}:{password}@{endpoint}:{port}/{username}"
-    echo = False
     connect_args = {}
+    pool_kwargs = pooling.pool_options()
+    concurrent_sqlite = False
 else:
-    db_url = "sqlite:///backend/pony_express.db"
-    echo = True
+    db_url = f"sqlite:///{os.environ.get('SQLITE_PATH', default='backend/pony_express.db')}"
     connect_args = {"check_same_thread": False}
+    # WAL, a pool of readers and a single writer; see backend.sqlite_mode
+    concurrent_sqlite = sqlite_mode.enabled
+    pool_kwargs = pooling.pool_options() if concurrent_sqlite else {}
+
+_engine = None
+_writer_engine = None
+_engine_lock = threading.Lock()
+
+
+def _build_engine(name: str, pool_options: dict):
+    engine = create_engine(
+        db_url,
+        connect_args=connect_args,
+        **pool_options,
+    )
+    if concurrent_sqlite:
+        sqlite_mode.apply_pragmas(engine)
+    pooling.instrument(engine, name)
+    metrics.instrument(engine)
+    querylog.instrument(engine)
+    return engine
+
+
+def get_engine():
+    """Create the engine on first use, so importing this module stays cheap."""
+    global _engine
+    if _engine is None:
+        with _engine_lock, startup.timed("create engine"):
+            if _engine is None:
+                _engine = _build_engine("sync", pool_kwargs)
+    return _engine
+
+
+def get_writer_engine():
+    """
+    The engine sessions send writes to in concurrent SQLite mode, or None
+    when writes share the main engine.
+    """
+    global _writer_engine
+    if _writer_engine is None and concurrent_sqlite:
+        with _engine_lock:
+            if _writer_engine is None:
+                _writer_engine = _build_engine("sync-writer", sqlite_mode.writer_pool_options())
+    return _writer_engine
+
+
+def __getattr__(name: str):
+    # keeps `database.engine` / `from backend.database import engine` working
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-engine = create_engine(
-    db_url,
-    echo=echo,
-    connect_args=connect_args,
-)
 
 def create_db_and_tables():
+    engine = get_engine()
     SQLModel.metadata.create_all(engine)
+    altered = _add_missing_columns(engine)
+    _stop_message_id_reuse(engine)
+    # create_all skips indexes on tables that already exist
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        search.create_search_index(connection)
+    if ChatInDB.__tablename__ in altered:
+        # new statistics columns start at zero; fill them in
+        with Session(engine) as session:
+            repair_chat_stats(session)
+
+def _add_missing_columns(engine) -> set[str]:
+    # create_all never alters existing tables; add new nullable/defaulted columns
+    altered = set()
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f" NOT NULL DEFAULT {getattr(default, 'text', default)}"
+                connection.execute(text(ddl))
+                altered.add(table.name)
+    return altered
+
+def _stop_message_id_reuse(engine):
+    # SQLite reuses the highest rowid once archiving empties messages; only
+    # AUTOINCREMENT prevents it, and adding that means rebuilding the table
+    if engine.dialect.name != "sqlite":
+        return
+    table = MessageInDB.__table__
+    with engine.begin() as connection:
+        sql = connection.scalar(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {"name": table.name})
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            return
+        for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        for index in table.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {table.name}_old"))
+        table.create(connection)
+        columns = ", ".join(column.name for column in table.columns)
+        connection.execute(text(
+            f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old"
+        ))
+        connection.execute(text(f"DROP TABLE {table.name}_old"))
+        # continue after archived messages too, not just the hot ones
+        connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": table.name})
+        connection.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+            {"name": table.name, "seq": connection.scalar(select(func.max(
+                func.coalesce(select(func.max(MessageInDB.id)).scalar_subquery(), 0),
+                func.coalesce(select(func.max(ArchivedMessageInDB.id)).scalar_subquery(), 0),
+            )))},
+        )
+        # the copy was indexed on top of the old entries
+        connection.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+
+
+def open_session() -> Session:
+    """A session reading through the engine and writing through the writer, if any."""
+    return sqlite_mode.RoutingSession(get_engine(), writer=get_writer_engine())
+
 
 def get_session():
-    with Session(engine) as session:
+    with open_session() as session:
         yield session
 
 
+def get_chat_message(session: Session, chat_id: int, message_id: int):
+    """
+    Retrieve a message of a chat, whether hot or archived.
+
+    :return: the MessageInDB or ArchivedMessageInDB
+    :raises EntityNotFoundException: if the chat has no message with this id
+    """
+    for model in (MessageInDB, ArchivedMessageInDB):
+        message = session.get(model, message_id)
+        if message is not None:
+            if message.chat_id == chat_id:
+                return message
+            break
+    raise EntityNotFoundException(entity_name="Message", entity_id=message_id)
+
+
 def update_message(session: Session, chat_id: int, message_id: int, user_id: int, new_message: NewMessage ) -> MessageInDB:
     """
     Update an message in the database.
@@ -237,9 +988,7 @@ def update_message(session: Session, chat_id: int, message_id: int, user_id: int
     """
 
     chat = get_chat_by_id(session, chat_id)
-    message = session.get(MessageInDB,message_id)
-    if not message:
-        raise EntityNotFoundException(entity_name="Message", entity_id=message_id)
+    message = get_chat_message(session, chat_id, message_id)
     if message.user_id != user_id:
         raise HTTPException(
             status_code = 403,
@@ -251,6 +1000,8 @@ def update_message(session: Session, chat_id: int, message_id: int, user_id: int
     if message and chat:
         message.text = new_message.text
         #message.created_at = datetime.now()
+        version = session.exec(chat_version_bump(chat_id)).scalar_one()
+        record_change(session, chat_id, message_id, "updated", version)
 
         session.commit()
         session.refresh(message)
@@ -261,10 +1012,8 @@ def update_message(session: Session, chat_id: int, message_id: int, user_id: int
 
 def delete_message(session: Session, chat_id: int, message_id: int, user_id: int):
     #chat = get_chat_by_id(session, chat_id)
-    message = session.get(MessageInDB,message_id)
     get_chat_by_id(session, chat_id)
-    if not message:
-        raise EntityNotFoundException(entity_name="Message", entity_id=message_id)
+    message = get_chat_message(session, chat_id, message_id)
     if message.user_id != user_id:
         raise HTTPException(
             status_code = 403,
@@ -274,5 +1023,8 @@ def delete_message(session: Session, chat_id: int, message_id: int, user_id: int
             })
     
     session.delete(message)
+    version = session.exec(chat_stats_on_delete(chat_id)).scalar_one()
+    record_change(session, chat_id, message_id, "deleted", version)
+    session.exec(unread_on_delete(chat_id, message_id))
     session.commit()
     
\ No newline at end of file
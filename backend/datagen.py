@@ -0,0 +1,419 @@
+import argparse
+import csv
+import functools
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import create_engine, func, select, text
+from sqlmodel import Session, SQLModel
+
+from backend import search
+from backend.database import bump_version, create_db_and_tables, get_engine, repair_chat_stats
+from backend.db_seeder import reset_sequence
+from backend.entities import ArchivedMessageInDB, ChatInDB, MessageInDB, UserChatLinkInDB, UserInDB
+from backend.passwords import password_hasher
+
+logger = logging.getLogger(__name__)
+
+# rows per executemany/COPY and per transaction
+batch_size = int(os.environ.get("DATAGEN_BATCH_SIZE", default="50000"))
+# processes generating messages while the main process loads them
+workers = int(os.environ.get("DATAGEN_WORKERS", default=str(os.cpu_count() or 1)))
+
+words = (
+    "the be to of and a in that have it for not on with he as you do at this but his by from they we say "
+    "her she or an will my one all would there their what so up out if about who get which go me when "
+    "make can like time no just him know take people into year your good some could them see other than "
+    "then now look only come its over think also back after use two how our work first well way even new "
+    "want because any these give day most us lunch meeting tomorrow deploy review thanks ok sure lol"
+).split()
+
+
+@dataclass
+class Shape:
+    """
+    What to generate. Loaded into an empty database, a shape and seed always
+    produce the same rows, bar the bcrypt salt of the shared password.
+    """
+
+    users: int = 1000
+    chats: int = 200
+    messages: int = 100_000
+    seed: int = 0
+    # exponent of the Zipf laws behind chat sizes, how many chats each user
+    # joins, how busy each chat is and how much each member writes
+    zipf: float = 1.1
+    max_members: int = 500
+    days: int = 365  # length of the generated history
+    end: datetime = datetime(2025, 1, 1)  # fixed, so output doesn't depend on the clock
+    password: str = "password"  # every generated user's password
+
+
+@dataclass
+class PlannedChat:
+    id: int
+    created_at: datetime
+    members: list[int]  # most talkative first
+
+
+def zipf_weights(count: int, exponent: float) -> list[float]:
+    """Cumulative weights of ranks 1..count, for random.choices(cum_weights=...)."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def timestamp(at: datetime) -> str:
+    # the format SQLAlchemy stores for DateTime on SQLite; Postgres parses it too
+    return at.isoformat(" ", "microseconds")
+
+
+def user_rows(shape: Shape, first_id: int, hashed_password: str):
+    rng = random.Random(f"{shape.seed}:users")
+    start = shape.end - timedelta(days=shape.days)
+    for offset in range(shape.users):
+        user_id = first_id + offset
+        # signups accelerate towards the end of the window, in id order
+        progress = ((offset + rng.random()) / shape.users) ** 0.5
+        created_at = start + timedelta(days=shape.days * progress)
+        yield (user_id, f"user{user_id}", f"user{user_id}@example.com", hashed_password, timestamp(created_at))
+
+
+def plan_chats(shape: Shape, first_user_id: int, first_chat_id: int) -> list[PlannedChat]:
+    """
+    Pick each chat's members: chat sizes follow a Zipf law (many small
+    chats, a few huge ones), and so does how often each user is picked.
+    """
+    rng = random.Random(f"{shape.seed}:chats")
+    start = shape.end - timedelta(days=shape.days)
+    users = list(range(first_user_id, first_user_id + shape.users))
+    by_popularity = users[:]
+    rng.shuffle(by_popularity)
+    popularity = zipf_weights(len(users), shape.zipf)
+    max_members = max(2, min(shape.max_members, len(users)))
+    sizes = zipf_weights(max_members - 1, shape.zipf)
+
+    chats = []
+    for offset in range(shape.chats):
+        size = min(len(users), rng.choices(range(2, max_members + 1), cum_weights=sizes)[0])
+        if size > len(users) // 2:
+            members = rng.sample(users, size)
+        else:
+            members = []
+            chosen = set()
+            while len(members) < size:
+                for user_id in rng.choices(by_popularity, cum_weights=popularity, k=size - len(members)):
+                    if user_id not in chosen:
+                        chosen.add(user_id)
+                        members.append(user_id)
+        created_at = start + timedelta(days=shape.days * rng.random() * 0.8)
+        chats.append(PlannedChat(first_chat_id + offset, created_at, members))
+    return chats
+
+
+def chat_rows(chats: list[PlannedChat]):
+    for chat in chats:
+        yield (chat.id, f"chat {chat.id}", chat.members[0], timestamp(chat.created_at))
+
+
+def link_rows(chats: list[PlannedChat]):
+    for chat in chats:
+        for user_id in chat.members:
+            yield (user_id, chat.id)
+
+
+def message_counts(shape: Shape, chats: list[PlannedChat]) -> list[int]:
+    """Split shape.messages over the chats by a Zipf law of chat activity."""
+    rng = random.Random(f"{shape.seed}:activity")
+    ranks = list(range(1, len(chats) + 1))
+    rng.shuffle(ranks)
+    weights = [1 / rank ** shape.zipf for rank in ranks]
+    total = sum(weights)
+    shares = [shape.messages * weight / total for weight in weights]
+    counts = [int(share) for share in shares]
+    # hand out what flooring left over to the largest remainders
+    by_remainder = sorted(range(len(chats)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[:shape.messages - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+@dataclass
+class Segment:
+    """A run of one chat's messages that can be generated on its own."""
+
+    key: str  # seeds the segment's generator
+    chat_id: int
+    members: list[int]
+    start: float  # seconds relative to shape.end
+    end: float
+    count: int
+    first_id: int
+
+
+def plan_segments(shape: Shape, chats: list[PlannedChat], first_id: int) -> list[Segment]:
+    """
+    Cut each chat's history into time slices of at most batch_size messages,
+    each with its own seed and id range, so they can be generated in any
+    order or in parallel and still give the same rows.
+    """
+    segments = []
+    message_id = first_id
+    for index, (chat, count) in enumerate(zip(chats, message_counts(shape, chats))):
+        # seconds relative to shape.end, so no time zone is involved
+        begin = (chat.created_at - shape.end).total_seconds()
+        parts = math.ceil(count / batch_size)
+        for part in range(parts):
+            part_count = count * (part + 1) // parts - count * part // parts
+            segments.append(Segment(
+                key=f"{shape.seed}:messages:{index}:{part}",
+                chat_id=chat.id,
+                members=chat.members,
+                start=begin - begin * part / parts,
+                end=begin - begin * (part + 1) / parts,
+                count=part_count,
+                first_id=message_id,
+            ))
+            message_id += part_count
+    return segments
+
+
+@functools.lru_cache(maxsize=4)
+def word_stream(seed: int) -> list[str]:
+    # texts are slices of one long word stream: far cheaper than drawing
+    # every word, and still varied enough for search
+    return random.Random(f"{seed}:words").choices(words, k=1 << 16)
+
+
+def segment_rows(shape: Shape, segment: Segment) -> list[tuple]:
+    """
+    A segment's messages in time order, so ids grow with created_at within a
+    chat. Gaps are bursty: most are short, and a few long pauses make up the
+    rest of the segment.
+    """
+    rng = random.Random(segment.key)
+    uniform = rng.random
+    stream = word_stream(shape.seed)
+    max_length = 60
+    authors = zipf_weights(len(segment.members), shape.zipf)
+    at = segment.start
+    mean_gap = (segment.end - segment.start) / (segment.count + 1)
+    short_gap, long_gap = mean_gap * 0.1, mean_gap * 4.6  # 0.8 * 0.1 + 0.2 * 4.6 = 1
+    rows = []
+    for message_id, author in enumerate(
+        rng.choices(segment.members, cum_weights=authors, k=segment.count), segment.first_id
+    ):
+        # exponential gaps and lengths, inlined from random.expovariate
+        at -= math.log(1.0 - uniform()) * (short_gap if uniform() < 0.8 else long_gap)
+        if at > segment.end:
+            at = segment.end
+        length = min(max_length, 1 - int(math.log(1.0 - uniform()) * 8))
+        offset = int(uniform() * (len(stream) - max_length))
+        rows.append((
+            message_id,
+            " ".join(stream[offset:offset + length]),
+            author,
+            segment.chat_id,
+            timestamp(shape.end + timedelta(seconds=at)),
+        ))
+    return rows
+
+
+def _segments_rows(shape: Shape, segments: list[Segment]) -> list[tuple]:
+    return [row for segment in segments for row in segment_rows(shape, segment)]
+
+
+def message_batches(shape: Shape, segments: list[Segment], workers: int):
+    """
+    Yield messages in batches of about batch_size rows, in id order. With
+    several workers, batches are generated in child processes while the
+    caller writes the previous ones.
+    """
+    tasks, task, size = [], [], 0
+    for segment in segments:
+        task.append(segment)
+        size += segment.count
+        if size >= batch_size:
+            tasks.append(task)
+            task, size = [], 0
+    if task:
+        tasks.append(task)
+
+    if workers <= 1:
+        for task in tasks:
+            yield _segments_rows(shape, task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # a bounded window of batches in flight keeps memory flat
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_segments_rows, shape, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def batched(rows) -> Iterator[list[tuple]]:
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield batch
+
+
+def write_batch(raw_connection, dialect: str, table: str, columns: list[str], rows: list[tuple]):
+    cursor = raw_connection.cursor()
+    if dialect == "postgresql":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    elif dialect == "sqlite":
+        placeholders = ", ".join("?" for _ in columns)
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    else:
+        raise ValueError(f"bulk loading into {dialect} is not supported")
+    cursor.close()
+
+
+def load_table(engine, cls, columns: list[str], batches: Iterable[list[tuple]]) -> dict[str, float]:
+    """
+    Bulk-load batches of rows with the driver directly (executemany on
+    SQLite, COPY on Postgres), committing after each batch. Non-unique
+    indexes are dropped for the load and rebuilt in one pass at the end.
+
+    :return: rows loaded and rows per second
+    """
+    dialect = engine.dialect.name
+    deferred = [index for index in cls.__table__.indexes if not index.unique]
+    for index in deferred:
+        index.drop(engine, checkfirst=True)
+    raw_connection = engine.raw_connection()
+    if dialect == "sqlite":
+        # generated data can be regenerated, so skip fsyncs while loading
+        cursor = raw_connection.cursor()
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.close()
+    start = time.perf_counter()
+    count = 0
+    try:
+        for batch in batches:
+            write_batch(raw_connection, dialect, cls.__tablename__, columns, batch)
+            raw_connection.commit()
+            count += len(batch)
+            logger.info("generated %s: %d rows", cls.__tablename__, count)
+    finally:
+        raw_connection.close()
+        for index in deferred:
+            index.create(engine, checkfirst=True)
+    seconds = time.perf_counter() - start
+    return {"rows": count, "rows_per_second": round(count / seconds) if seconds else 0}
+
+
+def next_id(engine, cls) -> int:
+    # archived messages keep their ids, so new ones start after them too
+    models = (cls, ArchivedMessageInDB) if cls is MessageInDB else (cls,)
+    with engine.connect() as connection:
+        return max(connection.scalar(select(func.coalesce(func.max(model.id), 0))) for model in models) + 1
+
+
+def drop_search_index(engine):
+    # maintaining the index row by row is slower than building it afterwards
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            connection.execute(text("DROP TRIGGER IF EXISTS messages_fts_insert"))
+        elif engine.dialect.name == "postgresql":
+            connection.execute(text("DROP INDEX IF EXISTS ix_messages_text_tsv"))
+
+
+def restore_search_index(engine, first_message_id: int):
+    with engine.begin() as connection:
+        search.create_search_index(connection)
+        if engine.dialect.name == "sqlite":
+            connection.execute(
+                text("INSERT INTO messages_fts(rowid, text) SELECT id, text FROM messages WHERE id >= :first_id"),
+                {"first_id": first_message_id},
+            )
+
+
+def generate(shape: Shape, target=None, processes: Optional[int] = None) -> dict:
+    """
+    Generate users, chats, memberships and messages and bulk-load them into
+    target (the app database by default). Existing rows are kept; generated
+    ids start after them.
+
+    :param processes: message generator processes (default: DATAGEN_WORKERS)
+    :return: per table, rows loaded and rows per second
+    """
+    if target is None:
+        create_db_and_tables()
+        target = get_engine()
+
+    first_user_id, first_chat_id, first_message_id = (
+        next_id(target, cls) for cls in (UserInDB, ChatInDB, MessageInDB)
+    )
+    hashed_password = password_hasher.context.hash(shape.password)
+    chats = plan_chats(shape, first_user_id, first_chat_id)
+
+    result = {
+        "users": load_table(
+            target, UserInDB, ["id", "username", "email", "hashed_password", "created_at"],
+            batched(user_rows(shape, first_user_id, hashed_password)),
+        ),
+        "chats": load_table(target, ChatInDB, ["id", "name", "owner_id", "created_at"], batched(chat_rows(chats))),
+        "links": load_table(target, UserChatLinkInDB, ["user_id", "chat_id"], batched(link_rows(chats))),
+    }
+    drop_search_index(target)
+    try:
+        result["messages"] = load_table(
+            target, MessageInDB, ["id", "text", "user_id", "chat_id", "created_at"],
+            message_batches(shape, plan_segments(shape, chats, first_message_id), processes or workers),
+        )
+    finally:
+        restore_search_index(target, first_message_id)
+
+    with target.begin() as connection:
+        for cls in (UserInDB, ChatInDB, MessageInDB):
+            reset_sequence(connection, cls)
+    with Session(target) as session:
+        if result["users"]["rows"]:
+            bump_version(session, "users")
+        repair_chat_stats(session)
+    return result
+
+
+def main():
+    """Generate data from the command line: python -m backend.datagen --help"""
+    parser = argparse.ArgumentParser(description="Generate synthetic users, chats and messages.")
+    defaults = Shape()
+    for field in fields(Shape):
+        if field.name == "end":
+            parser.add_argument("--end", type=datetime.fromisoformat, default=defaults.end)
+        else:
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(getattr(defaults, field.name)),
+                                default=getattr(defaults, field.name))
+    parser.add_argument("--url", help="SQLAlchemy URL of the target (default: the app database)")
+    parser.add_argument("--workers", type=int, default=workers, help="message generator processes")
+    args = vars(parser.parse_args())
+
+    processes = args.pop("workers")
+    url = args.pop("url")
+    shape = Shape(**args)
+    target = None
+    if url:
+        target = create_engine(url)
+        SQLModel.metadata.create_all(target)
+    logging.basicConfig(level=logging.INFO)
+    result = generate(shape, target, processes)
+    print(json.dumps({"shape": asdict(shape) | {"end": shape.end.isoformat()}, **result}))
+
+
+if __name__ == "__main__":
+    main()
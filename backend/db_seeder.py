@@ -1,130 +1,118 @@
 import json
+import logging
+import os
 
-from sqlalchemy import func
-from sqlmodel import Session, create_engine, select
+from sqlalchemy import func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, create_engine
 
 from backend.entities import *
-from backend.database import engine
+from backend.database import bump_version, create_db_and_tables, get_engine, repair_chat_stats
 
-SQLModel.metadata.create_all(engine)
+logger = logging.getLogger(__name__)
+
+# rows read, inserted and committed at a time
+batch_size = int(os.environ.get("SEED_BATCH_SIZE", default="5000"))
 
 local_engine = create_engine(
     "sqlite:///backend/initial.db",
     connect_args={"check_same_thread": False},
 )
 
+# parents before children, so foreign keys always resolve
+seed_order = [UserInDB, ChatInDB, MessageInDB, UserChatLinkInDB]
 
-def upsert_all(session, cls, local_models) -> int:
-    models = session.exec(select(cls)).all()
-    model_lookup = {model.id: model for model in models}
-    count = 0
-    for local_model in local_models:
-        if model_lookup.get(local_model.id) is None:
-            session.add(cls(**{
-                key: value
-                for key, value in local_model.model_dump().items()
-                if key != "id"
-            }))
-            count += 1
-    session.commit()
-    return count
-
-
-def upsert_links(session, local_models) -> int:
-    links = session.exec(select(UserChatLinkInDB)).all()
-    link_lookup = {(link.user_id, link.chat_id): link for link in links}
-    count = 0
-    for local_model in local_models:
-        if link_lookup.get((local_model.user_id, local_model.chat_id)) is None:
-            session.add(UserChatLinkInDB(**local_model.model_dump()))
-            count += 1
-    session.commit()
-    return count
-
-
-def get_count(session, model):
-    if model == UserChatLinkInDB:
-        return session.scalar(select(func.count(model.user_id)))
-    return session.scalar(select(func.count(model.id)))
-
-
-def add_users() -> dict[str, int]:
-    with Session(local_engine) as local_session:
-        users = local_session.exec(select(UserInDB)).all()
-        local_count = len(users)
-
-    with Session(engine) as session:
-        prev_count = get_count(session, UserInDB)
-        additions = upsert_all(session, UserInDB, users)
-        count = get_count(session, UserInDB)
+insert_builders = {
+    "sqlite": sqlite_insert,
+    "postgresql": postgresql_insert,
+}
 
-    return {
-        "local": local_count,
-        "prev": prev_count,
-        "additions": additions,
-        "final": count,
-    }
 
+def stream_local(source, cls):
+    """
+    Read a table from the source database in batches of batch_size rows,
+    without loading it all into memory.
 
-def add_chats() -> dict[str, int]:
-    with Session(local_engine) as local_session:
-        chats = local_session.exec(select(ChatInDB)).all()
-        local_count = len(chats)
+    initial.db predates some columns; only the ones it has are read, and the
+    target's defaults fill in the rest.
 
-    with Session(engine) as session:
-        prev_count = get_count(session, ChatInDB)
-        additions = upsert_all(session, ChatInDB, chats)
-        count = get_count(session, ChatInDB)
+    :return: iterator of lists of row dicts
+    """
+    present = {column["name"] for column in inspect(source).get_columns(cls.__tablename__)}
+    columns = [column for column in cls.__table__.columns if column.name in present]
+    with source.connect() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(select(*columns))
+        for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
 
-    return {
-        "local": local_count,
-        "prev": prev_count,
-        "additions": additions,
-        "final": count,
-    }
 
+def insert_missing(connection, cls, rows: list[dict]):
+    """Insert rows, skipping any whose primary key already exists."""
+    insert = insert_builders[connection.dialect.name]
+    connection.execute(insert(cls.__table__).on_conflict_do_nothing(), rows)
 
-def add_messages() -> dict[str, int]:
-    with Session(local_engine) as local_session:
-        messages = local_session.exec(select(MessageInDB)).all()
-        local_count = len(messages)
 
-    with Session(engine) as session:
-        prev_count = get_count(session, MessageInDB)
-        additions = upsert_all(session, MessageInDB, messages)
-        count = get_count(session, MessageInDB)
+def reset_sequence(connection, cls):
+    # rows were copied with their ids, so move Postgres' serial past them
+    if connection.dialect.name == "postgresql" and "id" in cls.__table__.columns:
+        table = cls.__table__
+        highest = select(func.coalesce(func.max(table.c.id), 0)).scalar_subquery()
+        if cls is MessageInDB:
+            # archived messages keep their ids; never hand those out again
+            archived = select(func.coalesce(func.max(ArchivedMessageInDB.id), 0)).scalar_subquery()
+            highest = func.greatest(highest, archived)
+        connection.execute(select(func.setval(
+            func.pg_get_serial_sequence(table.name, "id"),
+            highest + 1,
+            False,
+        )))
 
-    return {
-        "local": local_count,
-        "prev": prev_count,
-        "additions": additions,
-        "final": count,
-    }
 
+def get_count(connection, cls) -> int:
+    return connection.scalar(select(func.count()).select_from(cls.__table__))
 
-def add_user_chat_links() -> dict[str, int]:
-    with Session(local_engine) as local_session:
-        links = local_session.exec(select(UserChatLinkInDB)).all()
-        local_count = len(links)
 
-    with Session(engine) as session:
-        prev_count = get_count(session, UserChatLinkInDB)
-        additions = upsert_links(session, links)
-        count = get_count(session, UserChatLinkInDB)
+def seed_table(source, target, cls) -> dict[str, int]:
+    """
+    Copy one table from source to target, committing every batch.
+
+    :return: counts of rows read locally, present before, added and present after
+    """
+    with target.connect() as connection:
+        prev_count = get_count(connection, cls)
+
+    local_count = 0
+    for rows in stream_local(source, cls):
+        with target.begin() as connection:
+            insert_missing(connection, cls, rows)
+        local_count += len(rows)
+        logger.info("seeded %s: %d rows read", cls.__tablename__, local_count)
+
+    with target.begin() as connection:
+        reset_sequence(connection, cls)
+        count = get_count(connection, cls)
 
     return {
         "local": local_count,
         "prev": prev_count,
-        "additions": additions,
+        "additions": count - prev_count,
         "final": count,
     }
 
 
-def seed_database():
-    user_count = add_users()
-    chat_count = add_chats()
-    message_count = add_messages()
-    link_count = add_user_chat_links()
+def seed_database(source=local_engine, target=None):
+    if target is None:
+        create_db_and_tables()
+        target = get_engine()
+
+    user_count, chat_count, message_count, link_count = (
+        seed_table(source, target, cls) for cls in seed_order
+    )
+    with Session(target) as session:
+        if user_count["additions"]:
+            bump_version(session, "users")
+        repair_chat_stats(session)
 
     return {
         "user_count": user_count,
@@ -149,5 +137,5 @@ def lambda_handler(event, context):
 
 
 if __name__ == "__main__":
-    seed_database()
-
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(seed_database()))
@@ -2,10 +2,13 @@ from datetime import date, datetime
 
 from pydantic import BaseModel, Field
 
-from typing import Optional
+from typing import Literal, Optional
 
+from sqlalchemy import Index, event
 from sqlmodel import Field, Relationship, SQLModel, Session, create_engine
 
+from backend.cache import invalidate_membership
+
 
 
 
@@ -14,9 +17,17 @@ class UserChatLinkInDB(SQLModel, table=True):
     """Database model for many-to-many relation of users to chats."""
 
     __tablename__ = "user_chat_links"
+    # the primary key leads with user_id; per-chat member lookups need this
+    __table_args__ = (
+        Index("ix_user_chat_links_chat_id", "chat_id"),
+    )
 
     user_id: int = Field(foreign_key="users.id", primary_key=True)
     chat_id: int = Field(foreign_key="chats.id", primary_key=True)
+    last_read_message_id: Optional[int] = None
+    last_read_at: Optional[datetime] = None
+    # maintained by add_message/delete_message so unread badges need no scan
+    unread_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
 
 class UserInDB(SQLModel, table=True):
@@ -88,6 +99,12 @@ class ChatInDB(SQLModel, table=True):
     name: str
     owner_id: int = Field(foreign_key="users.id")
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
+    # maintained on message/membership writes; repair with backend.maintenance
+    message_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    member_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    last_message_at: Optional[datetime] = None
+    # bumped on every write visible in the chat's reads; backs their ETags
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
     owner: UserInDB = Relationship()
     users: list[UserInDB] = Relationship(
@@ -96,6 +113,19 @@ class ChatInDB(SQLModel, table=True):
     )
     messages: list["MessageInDB"] = Relationship(back_populates="chat")
 
+@event.listens_for(ChatInDB.users, "append")
+def _member_added(chat: ChatInDB, _user, _initiator):
+    chat.member_count = (chat.member_count or 0) + 1
+    chat.version = (chat.version or 0) + 1
+
+
+@event.listens_for(ChatInDB.users, "remove")
+def _member_removed(chat: ChatInDB, user, _initiator):
+    chat.member_count = (chat.member_count or 0) - 1
+    chat.version = (chat.version or 0) + 1
+    invalidate_membership(chat.id, user.id)
+
+
 class Chat(BaseModel):
     id: int
     name: str
@@ -108,6 +138,63 @@ class ChatCollection(BaseModel):
     meta: Metadata
     chats: list[Chat]
 
+
+class UserChat(Chat):
+    """Represents a chat as seen by one of its members."""
+
+    unread_count: int
+
+
+class UserChatCollection(BaseModel):
+    """Represents an API response for the current user's chats."""
+
+    meta: Metadata
+    chats: list[UserChat]
+
+
+class MessagePreview(BaseModel):
+    """Represents the start of a message, as shown in the inbox."""
+
+    id: int
+    text: str
+    user: User
+    created_at: datetime
+
+
+class InboxEntry(UserChat):
+    """Represents a chat in the current user's inbox."""
+
+    last_activity_at: datetime
+    last_message: Optional[MessagePreview] = None
+
+
+class InboxMetadata(Metadata):
+    """Represents metadata for a page of the inbox."""
+
+    next_cursor: Optional[str] = None
+
+
+class InboxCollection(BaseModel):
+    """Represents an API response for the current user's inbox."""
+
+    meta: InboxMetadata
+    chats: list[InboxEntry]
+
+
+class ReadMarker(BaseModel):
+    """Represents parameters for marking a chat as read."""
+
+    message_id: Optional[int] = None
+
+
+class ReadReceipt(BaseModel):
+    """Represents an API response for a user's read position in a chat."""
+
+    chat_id: int
+    last_read_message_id: Optional[int]
+    last_read_at: Optional[datetime]
+    unread_count: int
+
 class Message(SQLModel):
     id: int
     text: str
@@ -130,6 +217,11 @@ class MessageInDB(SQLModel, table=True):
     """Database model for message."""
 
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        # archiving can empty the table; never hand out an archived id again
+        {"sqlite_autoincrement": True},
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     text: str
@@ -141,15 +233,127 @@ class MessageInDB(SQLModel, table=True):
     chat: ChatInDB = Relationship(back_populates="messages")
 
 
+class ArchivedMessageInDB(SQLModel, table=True):
+    """
+    Database model for a message moved out of the hot messages table by
+    backend.maintenance. Archived messages keep their ids and can still be
+    searched, edited and deleted.
+    """
+
+    __tablename__ = "archived_messages"
+    __table_args__ = (
+        Index("ix_archived_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+    )
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    text: str
+    user_id: int = Field(foreign_key="users.id")
+    chat_id: int = Field(foreign_key="chats.id")
+    created_at: datetime
+
+    user: UserInDB = Relationship()
+
 
 class MessageResponse(BaseModel):
     message: Message
     
 
+class MsgMetadata(Metadata):
+    """Represents metadata for a page of messages."""
+
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+
+
+class SearchMetadata(Metadata):
+    """Represents metadata for a page of search results."""
+
+    next_offset: Optional[int] = None
+
+
+class SearchCollection(BaseModel):
+    """Represents an API response for ranked message search results."""
+
+    meta: SearchMetadata
+    messages: list[Message]
+
+
 class MsgCollection(BaseModel):
-    meta: Metadata
+    meta: MsgMetadata
     messages: list[Message]
 
 class NewMessage(BaseModel):
     """Represents parameters for sending a new message in the system."""
-    text: str
\ No newline at end of file
+    text: str
+
+
+class NewMessageBatch(BaseModel):
+    """Represents parameters for sending several messages at once."""
+
+    messages: list[NewMessage]
+
+
+class CreatedMessage(BaseModel):
+    """Represents the id and timestamp assigned to a created message."""
+
+    id: int
+    created_at: datetime
+
+
+class MessageBatchResponse(BaseModel):
+    """Represents an API response for a batch of created messages."""
+
+    meta: Metadata
+    messages: list[CreatedMessage]
+
+
+class VersionInDB(SQLModel, table=True):
+    """Database model for a named counter, bumped on every write to what it covers."""
+
+    __tablename__ = "versions"
+
+    name: str = Field(primary_key=True)
+    version: int = 0
+
+
+class ChatChangeInDB(SQLModel, table=True):
+    """Database model for one entry in a chat's message change log."""
+
+    __tablename__ = "chat_changes"
+    __table_args__ = (
+        Index("ix_chat_changes_chat_id_version", "chat_id", "version", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chat_id: int = Field(foreign_key="chats.id")
+    # the chat's version after this change, taken under the chat's row lock,
+    # so versions within a chat commit in order
+    version: int
+    message_id: int
+    kind: str
+    created_at: Optional[datetime] = Field(default_factory=datetime.now)
+
+
+class ChatChange(BaseModel):
+    """Represents a change to a message; message is None once deleted."""
+
+    version: int
+    type: Literal["created", "updated", "deleted"]
+    message_id: int
+    message: Optional[Message] = None
+
+
+class ChangeMetadata(Metadata):
+    """Represents metadata for a batch of changes."""
+
+    version: int
+    has_more: bool
+
+
+class ChangeCollection(BaseModel):
+    """Represents an API response for the changes in a chat since a version."""
+
+    meta: ChangeMetadata
+    changes: list[ChatChange]
+
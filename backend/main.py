@@ -1,18 +1,30 @@
+import time
+
+_import_start = time.perf_counter()
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, HTMLResponse
 from backend.auth import auth_router
 from backend.routers.chats import chats_router
+from backend.routers.messages import messages_router
 from backend.routers.users import users_router
 from backend.database import EntityNotFoundException
 from contextlib import asynccontextmanager
 from backend.database import create_db_and_tables
+from backend.async_database import dispose_engine
+from backend import startup
+from backend.metrics import MetricsMiddleware, metrics_router
 from mangum import Mangum
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    if startup.create_tables:
+        with startup.timed("create_db_and_tables"):
+            create_db_and_tables()
+    startup.log_report()
     yield
+    await dispose_engine()
 
 app = FastAPI(
     title="Messaging app",
@@ -21,6 +33,8 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "https://ie1uh9kp49.execute-api.us-east-1.amazonaws.com", "https://main.dl1uhvql3jcm4.amplifyapp.com"],
@@ -31,7 +45,9 @@ app.add_middleware(
 
 app.include_router(chats_router)
 app.include_router(users_router)
+app.include_router(messages_router)
 app.include_router(auth_router)
+app.include_router(metrics_router)
 
 @app.exception_handler(EntityNotFoundException)
 def handle_entity_not_found(
@@ -68,4 +84,6 @@ def default() -> str:
         """,
     )
 
-lambda_handler = Mangum(app)
\ No newline at end of file
+lambda_handler = Mangum(app)
+
+startup.record("import backend.main", time.perf_counter() - _import_start)
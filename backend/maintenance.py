@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+from backend.database import archive_messages, open_session, repair_chat_stats
+
+# messages older than this move to the archive table
+archive_after_days = int(os.environ.get("ARCHIVE_AFTER_DAYS", default="90"))
+archive_batch_size = int(os.environ.get("ARCHIVE_BATCH_SIZE", default="1000"))
+
+
+def repair() -> dict[str, int]:
+    """Recompute the denormalized per-chat statistics from the source rows."""
+    with open_session() as session:
+        return {"chats_repaired": repair_chat_stats(session)}
+
+
+def archive() -> dict[str, int]:
+    """Move messages older than ARCHIVE_AFTER_DAYS out of the hot messages table."""
+    cutoff = datetime.now() - timedelta(days=archive_after_days)
+    with open_session() as session:
+        return {"messages_archived": archive_messages(session, cutoff, archive_batch_size)}
+
+
+tasks = {
+    "repair": repair,
+    "archive": archive,
+}
+
+
+def lambda_handler(event, context):
+    try:
+        result = tasks[(event or {}).get("task", "repair")]()
+        return {
+            "statusCode": 200,
+            "body": json.dumps(result),
+        }
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+        }
+
+
+if __name__ == "__main__":
+    print(json.dumps(tasks[sys.argv[1] if len(sys.argv) > 1 else "repair"]()))
@@ -0,0 +1,233 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+from backend import pooling, startup
+from backend.cache import membership_cache, user_cache
+
+# Everything is kept in process and rendered on request, so /metrics works
+# the same under uvicorn and the Mangum Lambda handler. Under Lambda each
+# instance reports its own counters.
+
+enabled = os.environ.get("METRICS_ENABLED", default="true").lower() == "true"
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# requests that matched no route share one label, so unknown paths can't
+# grow the label set
+unmatched_route = "unmatched"
+
+
+class RequestStats:
+    """SQL work done while serving one request."""
+
+    __slots__ = ("scope", "statements", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.statements = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str | None:
+        """The matched route template; None until routing has happened."""
+        route = self.scope.get("route")
+        return route.path if route is not None else None
+
+
+current_request: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)  # (method, route, status) -> count
+        self.latency = {}  # (method, route) -> Histogram
+        self.statements = defaultdict(int)  # route -> count
+        self.db_seconds = defaultdict(float)  # route -> seconds
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            self.requests[(method, route, status)] += 1
+            histogram = self.latency.get((method, route))
+            if histogram is None:
+                histogram = self.latency[(method, route)] = Histogram(latency_buckets)
+            histogram.observe(seconds)
+            self.statements[route] += stats.statements
+            self.db_seconds[route] += stats.db_seconds
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.latency.clear()
+            self.statements.clear()
+            self.db_seconds.clear()
+
+    def render(self) -> str:
+        lines = []
+
+        def family(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_labels(labels)} {_number(value)}")
+
+        with self._lock:
+            family("http_requests_total", "counter", "Requests by route and status.", [
+                ("", {"method": method, "route": route, "status": status}, count)
+                for (method, route, status), count in sorted(self.requests.items())
+            ])
+            samples = []
+            for (method, route), histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    samples.append(("_bucket", {"method": method, "route": route, "le": bound}, cumulative))
+                samples.append(("_sum", {"method": method, "route": route}, histogram.total))
+                samples.append(("_count", {"method": method, "route": route}, cumulative))
+            family("http_request_duration_seconds", "histogram", "Request latency by route.", samples)
+            family("db_statements_total", "counter", "SQL statements executed by route.", [
+                ("", {"route": route}, count) for route, count in sorted(self.statements.items())
+            ])
+            family("db_time_seconds_total", "counter", "Time spent executing SQL by route.", [
+                ("", {"route": route}, seconds) for route, seconds in sorted(self.db_seconds.items())
+            ])
+
+        pools = sorted(pooling.pool_stats.items())
+        snapshots = [(name, stats.snapshot()) for name, stats in pools]
+        family("db_pool_checkouts_total", "counter", "Connections checked out of the pool.", [
+            ("", {"engine": name}, snapshot["checkouts"]) for name, snapshot in snapshots
+        ])
+        family("db_pool_timeouts_total", "counter", "Pool checkouts that timed out.", [
+            ("", {"engine": name}, snapshot["timeouts"]) for name, snapshot in snapshots
+        ])
+        family("db_pool_in_use", "gauge", "Connections currently checked out.", [
+            ("", {"engine": name}, snapshot["in_use"]) for name, snapshot in snapshots
+        ])
+        family("db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection.", [
+            ("", {"engine": name}, snapshot["total_wait_seconds"]) for name, snapshot in snapshots
+        ])
+
+        caches = [("user", user_cache.stats()), ("membership", membership_cache.stats())]
+        family("cache_hits_total", "counter", "Cache hits.", [
+            ("", {"cache": name}, stats["hits"]) for name, stats in caches
+        ])
+        family("cache_misses_total", "counter", "Cache misses.", [
+            ("", {"cache": name}, stats["misses"]) for name, stats in caches
+        ])
+        family("cache_entries", "gauge", "Entries currently cached.", [
+            ("", {"cache": name}, stats["size"]) for name, stats in caches
+        ])
+
+        family("startup_phase_seconds", "gauge", "Time spent in each cold-start phase.", [
+            ("", {"phase": phase}, seconds) for phase, seconds in sorted(startup.report().items())
+        ])
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{_number(value) if isinstance(value, float) else _escape(str(value))}"'
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request and attributing the SQL run
+    while serving it to the matched route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            registry.record_request(
+                scope["method"],
+                stats.route or unmatched_route,
+                status,
+                time.perf_counter() - start,
+                stats,
+            )
+
+
+def instrument(engine):
+    """
+    Count statements and time spent in them for the current request.
+
+    :param engine: a sync Engine (use .sync_engine for async engines)
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(_conn, _cursor, _statement, _parameters, context, _executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(_conn, _cursor, _statement, _parameters, context, _executemany):
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += time.perf_counter() - context._metrics_start
+
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+
+@metrics_router.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
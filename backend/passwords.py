@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+bcrypt_rounds = int(os.environ.get("BCRYPT_ROUNDS", default="12"))
+hash_workers = int(os.environ.get("PASSWORD_HASH_WORKERS", default="2"))
+hash_queue_size = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", default="32"))
+hash_queue_timeout = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", default="2"))  # seconds
+
+
+def build_context(rounds: int) -> CryptContext:
+    """Crypt context that flags any bcrypt hash with a different cost for rehashing."""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+class HasherBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail={
+                "error": "temporarily_unavailable",
+                "error_description": "too many concurrent authentication requests",
+            },
+            headers={"Retry-After": "1"},
+        )
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, size-limited executor.
+
+    Hashing never occupies the route threadpool or the event loop, so a burst
+    of logins cannot starve other endpoints. When max_pending calls are already
+    queued, or a call waits longer than queue_timeout to start, HasherBusy
+    (503) is raised instead of queueing indefinitely.
+    """
+
+    def __init__(
+        self,
+        context: CryptContext,
+        max_workers: int = hash_workers,
+        max_pending: int = hash_queue_size,
+        queue_timeout: float = hash_queue_timeout,
+    ):
+        self.context = context
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """Verify a password; also returns a new hash if the stored one is outdated."""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HasherBusy()
+            self._pending += 1
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def mark_started():
+            if not started.done():
+                started.set_result(None)
+
+        def task():
+            try:
+                loop.call_soon_threadsafe(mark_started)
+            except RuntimeError:
+                pass  # caller's loop is gone; the result is discarded anyway
+            return fn(*args)
+
+        try:
+            future = self._executor.submit(task)
+            try:
+                await asyncio.wait_for(asyncio.shield(started), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                if future.cancel():
+                    raise HasherBusy()
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+pwd_context = build_context(bcrypt_rounds)
+
+password_hasher = PasswordHasher(pwd_context)
@@ -0,0 +1,43 @@
+from fastapi import Depends, HTTPException
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import async_database as adb
+from backend.auth import get_current_user
+from backend.cache import membership_cache
+from backend.database import EntityNotFoundException
+from backend.entities import ChatInDB, UserInDB
+
+
+async def is_chat_member(session: AsyncSession, chat_id: int, user_id: int) -> bool:
+    """Whether a user belongs to a chat; one primary-key EXISTS lookup, cached when true."""
+    key = (chat_id, user_id)
+    if membership_cache.get(key):
+        return True
+    member = await adb.is_chat_member(session, chat_id, user_id)
+    if member:
+        membership_cache.set(key, True)
+    return member
+
+
+async def chat_member(
+    chat_id: int,
+    user: UserInDB = Depends(get_current_user),
+    session: AsyncSession = Depends(adb.get_session),
+) -> UserInDB:
+    """
+    Dependency for routes under /chats/{chat_id}: the current user, who must
+    be a member of the chat.
+
+    :raises EntityNotFoundException: if no such chat id exists
+    :raises HTTPException: 403 if the user is not a member
+    """
+    if await is_chat_member(session, chat_id, user.id):
+        return user
+    if await session.get(ChatInDB, chat_id) is None:
+        raise EntityNotFoundException(entity_name="Chat", entity_id=chat_id)
+    raise HTTPException(
+        status_code = 403,
+        detail={
+            "error": "no_permission",
+            "error_description": "requires permission to view chat"
+        })
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+# "queue" keeps a pool per process (uvicorn); "null" opens a connection per
+# checkout and leaves pooling to an external pooler such as RDS Proxy or
+# PgBouncer, which suits Lambda where idle pooled connections go stale.
+pool_mode = os.environ.get(
+    "DB_POOL_MODE",
+    default="null" if "AWS_LAMBDA_FUNCTION_NAME" in os.environ else "queue",
+)
+pool_size = int(os.environ.get("DB_POOL_SIZE", default="5"))
+max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", default="10"))
+pool_timeout = float(os.environ.get("DB_POOL_TIMEOUT", default="30"))  # seconds
+pool_recycle = int(os.environ.get("DB_POOL_RECYCLE", default="1800"))  # seconds
+pool_pre_ping = os.environ.get("DB_POOL_PRE_PING", default="true").lower() == "true"
+
+
+class PoolStats:
+    """Checkout wait times and in-use counts for one engine's pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def checked_out(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "total_wait_seconds": self.total_wait,
+                "max_wait_seconds": self.max_wait,
+            }
+
+
+class _TimedGetMixin:
+    """Times how long callers wait for a connection from the pool."""
+
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if self.stats is not None:
+                self.stats.record_timeout()
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_TimedGetMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedGetMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# stats per engine name, e.g. "sync" and "async"
+pool_stats: dict[str, PoolStats] = {}
+
+
+def pool_options(is_async: bool = False) -> dict:
+    """Keyword arguments for create_engine/create_async_engine per DB_POOL_MODE."""
+    if pool_mode == "null":
+        return {"poolclass": NullPool, "pool_pre_ping": pool_pre_ping}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+    }
+
+
+def instrument(engine, name: str) -> PoolStats:
+    """
+    Track checkouts for an engine's pool under the given name.
+
+    :param engine: a sync Engine (use .sync_engine for async engines)
+    :return: the stats being collected
+    """
+    stats = pool_stats.setdefault(name, PoolStats())
+    if isinstance(engine.pool, _TimedGetMixin):
+        engine.pool.stats = stats
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(_dbapi_connection, _connection_record, _connection_proxy):
+        stats.checked_out()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(_dbapi_connection, _connection_record):
+        stats.checked_in()
+
+    return stats
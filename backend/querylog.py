@@ -0,0 +1,148 @@
+import atexit
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable
+
+import orjson
+from sqlalchemy import event
+
+from backend.metrics import current_request
+
+# Structured, sampled replacement for echo=True. A statement is logged when it
+# is sampled or when it runs longer than the slow threshold; the request path
+# only appends to an in-memory buffer, and a background thread writes JSON
+# lines. Parameter values are never logged, only a fingerprint of them.
+
+enabled = os.environ.get("QUERY_LOG_ENABLED", default="true").lower() == "true"
+sample_rate = float(os.environ.get("QUERY_LOG_SAMPLE_RATE", default="0.01"))
+slow_threshold = float(os.environ.get("QUERY_LOG_SLOW_MS", default="100")) / 1000  # seconds
+# JSON lines go to this file, or to stderr when unset
+log_path = os.environ.get("QUERY_LOG_PATH")
+buffer_size = int(os.environ.get("QUERY_LOG_BUFFER_SIZE", default="10000"))
+flush_interval = float(os.environ.get("QUERY_LOG_FLUSH_INTERVAL", default="1"))  # seconds
+
+_literals = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+_placeholder_lists = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|\$\d+))+\s*\)")
+_whitespace = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """
+    Reduce a statement to its shape: literals become ?, placeholder lists of
+    any length (IN lists, multi-row VALUES) collapse to (?...), and whitespace
+    is squeezed, so the same query groups together whatever its arguments.
+    """
+    statement = _literals.sub("?", statement)
+    statement = _placeholder_lists.sub("(?...)", statement)
+    return _whitespace.sub(" ", statement).strip()
+
+
+def fingerprint(parameters) -> str:
+    """A short hash of the bound values, to spot repeated identical calls."""
+    return hashlib.blake2b(repr(parameters).encode(), digest_size=8).hexdigest()
+
+
+class BufferedSink:
+    """
+    Collects records in a bounded buffer and writes them from a daemon
+    thread, so logging never blocks a request on I/O. When the buffer is
+    full the oldest records are dropped and counted. With background=False
+    nothing is written until flush() is called.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[bytes], None],
+        maxsize: int = buffer_size,
+        interval: float = flush_interval,
+        background: bool = True,
+    ):
+        self.write = write
+        self.interval = interval
+        self.background = background
+        self.dropped = 0
+        self._buffer: deque[dict] = deque(maxlen=maxsize)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def emit(self, record: dict):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(record)
+        if self._thread is None and self.background:
+            self._start()
+        if len(self._buffer) >= self._buffer.maxlen // 2:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            lines = []
+            while self._buffer:
+                lines.append(orjson.dumps(self._buffer.popleft()))
+            if lines:
+                self.write(b"\n".join(lines) + b"\n")
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="querylog", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+
+def _write(data: bytes):
+    if log_path:
+        with open(log_path, "ab") as file:
+            file.write(data)
+    else:
+        sys.stderr.buffer.write(data)
+        sys.stderr.flush()
+
+
+sink = BufferedSink(_write)
+
+
+def instrument(engine):
+    """
+    Log sampled and slow statements run on this engine.
+
+    :param engine: a sync Engine (use .sync_engine for async engines)
+    """
+    if not enabled:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(_conn, _cursor, _statement, _parameters, context, _executemany):
+        context._querylog_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(_conn, _cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._querylog_start
+        slow = duration >= slow_threshold
+        if not slow and random.random() >= sample_rate:
+            return
+        request = current_request.get()
+        sink.emit({
+            "at": datetime.now(timezone.utc),
+            "statement": normalize(statement),
+            "params": fingerprint(parameters),
+            "executemany": executemany,
+            "duration_ms": round(duration * 1000, 3),
+            "slow": slow,
+            "route": request.route if request is not None else None,
+            "engine": engine.dialect.name,
+        })
@@ -0,0 +1,136 @@
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+from fastapi import Depends, HTTPException, Response
+
+from backend.auth import get_current_user
+from backend.entities import UserInDB
+
+enabled = os.environ.get("RATE_LIMIT_ENABLED", default="true").lower() == "true"
+# most buckets kept in memory, and how long an untouched bucket is kept
+max_buckets = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", default="10000"))
+idle_ttl = float(os.environ.get("RATE_LIMIT_IDLE_TTL", default="600"))  # seconds
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # seconds until a token is available; 0 if allowed
+    reset_after: float  # seconds until the bucket is full again
+
+
+class RateLimitStore(ABC):
+    """
+    Where token buckets live. The in-memory store suits a single process;
+    a shared store (e.g. Redis) can implement take() to limit across
+    processes without changing the routes.
+    """
+
+    @abstractmethod
+    async def take(self, key: Hashable, capacity: int, refill_per_second: float, cost: int = 1) -> Decision:
+        """Take cost tokens from the bucket for key, if it has them."""
+
+
+class MemoryStore(RateLimitStore):
+    """
+    Token buckets in a bounded LRU dict. Buckets idle for longer than
+    idle_ttl are evicted; by then they would have refilled anyway, so
+    eviction never changes a decision unless the LRU bound forces it.
+    """
+
+    def __init__(self, maxsize: int = max_buckets, idle_ttl: float = idle_ttl, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    async def take(self, key: Hashable, capacity: int, refill_per_second: float, cost: int = 1) -> Decision:
+        with self._lock:
+            now = self.clock()
+            self._evict_idle(now)
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return Decision(
+            allowed=allowed,
+            limit=capacity,
+            remaining=math.floor(tokens),
+            retry_after=0 if allowed else (cost - tokens) / refill_per_second,
+            reset_after=(capacity - tokens) / refill_per_second,
+        )
+
+    def _evict_idle(self, now: float):
+        # least recently used first, so stop at the first bucket still in use
+        while self._buckets:
+            key, (_tokens, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_ttl:
+                return
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+store: RateLimitStore = MemoryStore()
+
+
+class RateLimit:
+    """
+    Dependency limiting a route per authenticated user with a token bucket.
+
+    The bucket holds `capacity` requests and refills over `per_seconds`; both
+    can be overridden with RATE_LIMIT_<NAME>="<capacity>/<seconds>".
+    Allowed responses carry RateLimit-* headers; refused ones are a 429 with
+    Retry-After as well.
+    """
+
+    def __init__(self, name: str, capacity: int, per_seconds: float):
+        override = os.environ.get(f"RATE_LIMIT_{name.upper()}")
+        if override:
+            capacity, per_seconds = override.split("/")
+        self.name = name
+        self.capacity = int(capacity)
+        self.refill_per_second = int(capacity) / float(per_seconds)
+
+    async def __call__(self, response: Response, user: UserInDB = Depends(get_current_user)) -> UserInDB:
+        if not enabled:
+            return user
+        decision = await store.take((self.name, user.id), self.capacity, self.refill_per_second)
+        headers = {
+            "RateLimit-Limit": str(decision.limit),
+            "RateLimit-Remaining": str(decision.remaining),
+            "RateLimit-Reset": str(math.ceil(decision.reset_after)),
+        }
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=429,
+                detail={
+                    "error": "rate_limited",
+                    "error_description": f"too many {self.name} requests",
+                },
+                headers={**headers, "Retry-After": str(math.ceil(decision.retry_after))},
+            )
+        response.headers.update(headers)
+        return user
+
+
+# per-route buckets for write endpoints
+post_message_limit = RateLimit("post_message", capacity=30, per_seconds=10)
+post_message_batch_limit = RateLimit("post_message_batch", capacity=5, per_seconds=10)
+edit_message_limit = RateLimit("edit_message", capacity=30, per_seconds=60)
+update_user_limit = RateLimit("update_user", capacity=5, per_seconds=60)
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+queue_size = int(os.environ.get("WS_QUEUE_SIZE", default="256"))
+
+# close code sent to a client whose send queue overflowed
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class Subscription:
+    """A single websocket's bounded queue of pending chat events."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event: dict):
+        """Enqueue an event; must run on the subscription's own loop."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # drop the backlog and wake the sender so it closes the socket
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class ChatHub:
+    """
+    In-process fan-out of chat events to websocket subscribers.
+
+    Publishing never blocks: each subscriber has its own bounded queue, and a
+    subscriber that falls behind is disconnected instead of stalling others.
+    publish may be called from any thread, including the route threadpool.
+    """
+
+    def __init__(self, maxsize: int = queue_size):
+        self.maxsize = maxsize
+        self._subscriptions: dict[int, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def subscribe(self, chat_id: int):
+        subscription = Subscription(asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(chat_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscriptions.get(chat_id, set())
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self._subscriptions.pop(chat_id, None)
+
+    def publish(self, chat_id: int, event: dict):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(chat_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # loop already closed; the subscription is being torn down
+                pass
+
+
+hub = ChatHub()
+
+
+async def serve(websocket: WebSocket, subscription: Subscription):
+    """Forward events to the websocket until either side goes away."""
+
+    async def forward():
+        while True:
+            event = await subscription.queue.get()
+            if event is None:
+                await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+                return
+            await websocket.send_json(event)
+
+    async def drain():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    tasks = {asyncio.create_task(forward()), asyncio.create_task(drain())}
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        # a failed send just means the client is gone
+        if not task.cancelled():
+            task.exception()
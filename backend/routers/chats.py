@@ -1,64 +1,164 @@
-from fastapi import APIRouter, Depends, Query
-from datetime import date
+import os
+
+from fastapi import APIRouter, Depends, Query, Request, Response, WebSocket
+from datetime import date, datetime
 from typing import List, Literal,Optional
 from fastapi.exceptions import HTTPException
-from backend.auth import get_current_user
+from backend.auth import AuthException, get_current_user, get_user_from_token
 from backend.entities import (
     User,
     UserInDB,
     ChatInDB,
-    ChatCollection,
     ChatResponse,
     ChatUpdate,
     Chat,
+    ChangeCollection,
+    InboxCollection,
+    ChatChange,
     MsgCollection,
+    SearchCollection,
+    ReadMarker,
+    ReadReceipt,
+    UserChatCollection,
+    MessageBatchResponse,
     MessageResponse,
     NewMessage,
+    NewMessageBatch,
     Message,
     UserCollection,
 )
+from backend import async_database as adb
+from backend import conditional
+from backend.serialization import RowSerializer, render
 from backend import database as db
+from backend.permissions import chat_member, is_chat_member
+from backend.ratelimit import edit_message_limit, post_message_batch_limit, post_message_limit
+from backend.realtime import hub, serve
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 
 chats_router = APIRouter(prefix="/chats", tags=["Chats"])
 
+# characters of the latest message shown in the inbox
+preview_length = 140
+# most messages accepted by one messages:batch request
+max_batch_size = int(os.environ.get("MESSAGE_BATCH_MAX_SIZE", default="500"))
+
 @chats_router.post(
     "/{chat_id}/messages",
     response_model=MessageResponse,
     description="Creates a new message for chat with the given chat id.",
-    status_code=201
+    status_code=201,
+    dependencies=[Depends(post_message_limit)],
 )
-def post_msg(new_message: NewMessage, chat_id= int, user: UserInDB = Depends(get_current_user),  session: Session = Depends(db.get_session)):
-    chatInDB = db.get_chat_by_id(session, chat_id)
+async def post_msg(new_message: NewMessage, chat_id: int, user: UserInDB = Depends(chat_member),  session: AsyncSession = Depends(adb.get_session)):
+    message_response = await adb.add_message(session, user, chat_id, new_message)
+    hub.publish(chat_id, {
+        "type": "message_created",
+        "message": message_response.message.model_dump(mode="json"),
+    })
+    return message_response
+
+
 
-    if user not in chatInDB.users:
+@chats_router.post(
+    "/{chat_id}/messages:batch",
+    response_model=MessageBatchResponse,
+    description="Creates several messages for chat with the given chat id in one transaction.",
+    status_code=201,
+    dependencies=[Depends(post_message_batch_limit)],
+)
+async def post_msg_batch(batch: NewMessageBatch, chat_id: int, user: UserInDB = Depends(chat_member), session: AsyncSession = Depends(adb.get_session)):
+    if not 1 <= len(batch.messages) <= max_batch_size:
         raise HTTPException(
-            status_code = 403,
+            status_code = 422,
             detail={
-                "error": "no_permission",
-                "error_description": "requires permission to view chat"
+                "type": "invalid_batch_size",
+                "error_description": f"a batch holds between 1 and {max_batch_size} messages"
             })
-    return db.add_message(session, user, chat_id, new_message)
 
+    created = await adb.add_messages(session, user, chat_id, batch.messages)
+    messageUser = User(id=user.id, username=user.username, email=user.email, created_at=user.created_at)
+    for (message_id, created_at), new_message in zip(created, batch.messages):
+        message = Message(id=message_id, text=new_message.text, chat_id=chat_id, user=messageUser, created_at=created_at)
+        hub.publish(chat_id, {
+            "type": "message_created",
+            "message": message.model_dump(mode="json"),
+        })
+    return MessageBatchResponse(
+        meta={"count": len(created)},
+        messages=[{"id": message_id, "created_at": created_at} for message_id, created_at in created],
+    )
 
 
 @chats_router.get("", 
-                  response_model=ChatCollection,
-                  description="Get all chats.",)
-def get_chats(session: Session = Depends(db.get_session), user: UserInDB = Depends(get_current_user)
+                  response_model=UserChatCollection,
+                  description="Get all chats of the current user, with unread counts.",)
+async def get_chats(session: AsyncSession = Depends(adb.get_session), user: UserInDB = Depends(get_current_user)
+):
+    chatsInDB = await adb.get_chats_with_unread(session,user.id)
+    rows = RowSerializer()
+    sort_key = lambda row: row[0].name
+    chats = [rows.chat(chat, unread_count=unread_count) for chat, unread_count in sorted(chatsInDB, key=sort_key)]
+    return render({"meta": {"count": len(chats)}, "chats": chats})
+
+async def _chat_etag(session: AsyncSession, chat_id: int, *parts) -> str:
+    """ETag for a read of a chat, from its version markers rather than its rows."""
+    chat_version, users_version = await adb.get_chat_version(session, chat_id)
+    return conditional.make_etag(chat_id, chat_version, users_version, *parts)
+
+@chats_router.get(
+    "/inbox",
+    response_model=InboxCollection,
+    description="Get the current user's chats, most recently active first, with the latest message in each.",
+)
+async def get_inbox(
+    limit: int = Query(50, ge=1, le=200, description="Maximum number of chats to return"),
+    before: Optional[str] = Query(None, description="Return chats less recently active than this cursor"),
+    session: AsyncSession = Depends(adb.get_session),
+    user: UserInDB = Depends(get_current_user),
+):
+    rows, next_cursor = await adb.get_inbox(session, user.id, limit, before=before)
+    serializer = RowSerializer()
+    entries = []
+    for chat, unread_count, activity, last_message in rows:
+        preview = None
+        if last_message is not None:
+            preview = {
+                "id": last_message.id,
+                "text": last_message.text[:preview_length],
+                "user": serializer.user(last_message.user),
+                "created_at": last_message.created_at,
+            }
+        entries.append(serializer.chat(
+            chat,
+            unread_count=unread_count,
+            last_activity_at=activity,
+            last_message=preview,
+        ))
+    return render({"meta": {"count": len(entries), "next_cursor": next_cursor}, "chats": entries})
+
+@chats_router.post(
+    "/{chat_id}/read",
+    response_model=ReadReceipt,
+    description="Mark messages in chat with given chat id as read.",
+)
+def mark_read(
+    chat_id: int,
+    marker: Optional[ReadMarker] = None,
+    session: Session = Depends(db.get_session),
+    user: UserInDB = Depends(chat_member),
 ):
-    chatsInDB = db.get_chats_with_user(session,user.id)
-    chats_response = []
-    for chat in chatsInDB:
-        userInDB = db.get_user_by_id(session,chat.owner.id)
-        userResponse = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
-        chat_response = Chat(id=chat.id, name=chat.name, owner=userResponse, created_at=chat.created_at)
-        chats_response.append(chat_response)
-    sort_key = lambda chat: chat.name
-    return ChatCollection(
-        meta={"count": len(chats_response)},
-        chats=sorted(chats_response, key=sort_key),
+    """Move the current user's read marker; defaults to the newest message."""
+    message_id = marker.message_id if marker is not None else None
+    link = db.mark_chat_read(session, user.id, chat_id, message_id)
+    return ReadReceipt(
+        chat_id=chat_id,
+        last_read_message_id=link.last_read_message_id,
+        last_read_at=link.last_read_at,
+        unread_count=link.unread_count,
     )
 
 @chats_router.get(
@@ -66,41 +166,44 @@ def get_chats(session: Session = Depends(db.get_session), user: UserInDB = Depen
     description="Retrieve a chat by id",
     #response_model=ChatResponse
 )
-def get_chat(
+async def get_chat(
     chat_id: int,
+    request: Request,
+    response: Response,
     include: List[str] = Query([], description="List of keys to include in the response"),
-    session: Session = Depends(db.get_session),
-    user: UserInDB = Depends(get_current_user),
+    session: AsyncSession = Depends(adb.get_session),
+    user: UserInDB = Depends(chat_member),
 ):
     """
     Returns a chat using the provided chat ID.
     """
-    chatInDB = db.get_chat_by_id(session, chat_id)
+    etag = await _chat_etag(session, chat_id, "chat", sorted(set(include)))
+    if conditional.matches(request, etag):
+        return conditional.not_modified(etag)
+    response.headers.update(conditional.headers(etag))
 
-    if user not in chatInDB.users:
-        raise HTTPException(
-            status_code = 403,
-            detail={
-                "error": "no_permission",
-                "error_description": "requires permission to view chat"
-            })
+    chatInDB = await adb.get_chat_by_id(session, chat_id)
 
-    userInDB = db.get_user_by_id(session,chatInDB.owner.id)
+    userInDB = chatInDB.owner
     userResponse = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
 
     chat = Chat(id=chatInDB.id, name=chatInDB.name, owner=userResponse, created_at=chatInDB.created_at)
-    messages = db.get_messages_in_chat(session, chat_id)
-    meta = {"message_count":len(messages), "user_count": len(chatInDB.users)}
+    meta = {
+        "message_count": chatInDB.message_count,
+        "user_count": chatInDB.member_count,
+        "last_message_at": chatInDB.last_message_at,
+    }
 
     response_data = {"meta": meta, "chat": chat}
 
     if "messages" in include:
+        messages = await adb.get_messages_in_chat(session, chat_id)
         updatedMessages = [Message(id=message.id, text=message.text, chat_id=message.chat_id, user=message.user,created_at = message.created_at)
              for message in messages]
         response_data["messages"] = updatedMessages
 
     if "users" in include:
-        users = db.get_users_in_chat(session, chat_id)
+        users = await adb.get_users_in_chat(session, chat_id)
         updatedUsers = [User(id=user.id, username=user.username, email=user.email, created_at=user.created_at)
              for user in users]
         response_data["users"] = updatedUsers
@@ -116,7 +219,7 @@ def get_chat(
 def update_chat(chat_id: int, chat_update: ChatUpdate, session: Session = Depends(db.get_session)):
     """Update an chat for a given id."""
     chatInDB = db.update_chat(session, chat_id, chat_update)
-    userInDB = db.get_user_by_id(session,chatInDB.owner.id)
+    userInDB = chatInDB.owner
     userResponse = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
     chat_response = Chat(id=chatInDB.id, name=chatInDB.name, owner=userResponse, created_at=chatInDB.created_at)
     return ChatResponse(
@@ -129,26 +232,93 @@ def update_chat(chat_id: int, chat_update: ChatUpdate, session: Session = Depend
     description="Get messages for chat with given chat id.",
     
 )
-def get_msgs(chat_id: int, session: Session = Depends(db.get_session), user: UserInDB = Depends(get_current_user)):
-    messagesInDB = db.get_messages_in_chat(session, chat_id)
-    chatInDB = db.get_chat_by_id(session, chat_id)
-    if user not in chatInDB.users:
+async def get_msgs(
+    chat_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500, description="Maximum number of messages to return"),
+    before: Optional[str] = Query(None, description="Return messages older than this cursor"),
+    after: Optional[str] = Query(None, description="Return messages newer than this cursor"),
+    at: Optional[datetime] = Query(None, description="Jump to the first message at or after this timestamp"),
+    session: AsyncSession = Depends(adb.get_session),
+    user: UserInDB = Depends(chat_member),
+):
+    etag = await _chat_etag(session, chat_id, "messages", limit, before, after, at)
+    if conditional.matches(request, etag):
+        return conditional.not_modified(etag)
+    response.headers.update(conditional.headers(etag))
+
+    if sum(param is not None for param in (before, after, at)) > 1:
         raise HTTPException(
-            status_code = 403,
+            status_code = 422,
             detail={
-                "error": "no_permission",
-                "error_description": "requires permission to view chat"
+                "type": "invalid_pagination",
+                "error_description": "only one of before, after and at may be given"
             })
-    messages = []
-    for messageDB in messagesInDB:
-        userInDB = messageDB.user
-        messageUser = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
-        message = Message(id= messageDB.id, text= messageDB.text, chat_id= messageDB.chat_id, user= messageUser, created_at=messageDB.created_at)
-        messages.append(message)
-    sort_key = lambda msg: msg.created_at
-    return MsgCollection(
-        meta={"count": len(messages)},
-        messages=sorted(messages, key=sort_key),
+    if at is not None and at.tzinfo is not None:
+        at = at.astimezone().replace(tzinfo=None)
+
+    messagesInDB, prev_cursor, next_cursor = await adb.get_message_page(
+        session, chat_id, limit, before=before, after=after, at=at
+    )
+    rows = RowSerializer()
+    messages = [rows.message(message) for message in messagesInDB]
+    return render(
+        {
+            "meta": {"count": len(messages), "prev_cursor": prev_cursor, "next_cursor": next_cursor},
+            "messages": messages,
+        },
+        headers=conditional.headers(etag),
+    )
+
+@chats_router.get(
+    "/{chat_id}/messages/search",
+    response_model=SearchCollection,
+    description="Full-text search of messages in chat with given chat id.",
+)
+async def search_msgs(
+    chat_id: int,
+    q: str = Query(..., pattern=r"\S", description="Search text, with at least one non-space character"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    offset: int = Query(0, ge=0, description="Number of results to skip"),
+    session: AsyncSession = Depends(adb.get_session),
+    user: UserInDB = Depends(chat_member),
+):
+    messagesInDB = await adb.search_messages(session, q, limit + 1, offset, chat_id=chat_id)
+    rows = RowSerializer()
+    messages = [rows.message(message) for message in messagesInDB[:limit]]
+    next_offset = offset + limit if len(messagesInDB) > limit else None
+    return render({"meta": {"count": len(messages), "next_offset": next_offset}, "messages": messages})
+
+@chats_router.get(
+    "/{chat_id}/changes",
+    response_model=ChangeCollection,
+    description="Get message changes in a chat since a version.",
+)
+def get_changes(
+    chat_id: int,
+    since: int = Query(0, ge=0, description="Version returned by the previous call"),
+    limit: int = Query(500, ge=1, le=1000, description="Maximum number of change log entries to read"),
+    session: Session = Depends(db.get_session),
+    user: UserInDB = Depends(chat_member),
+):
+    deltas, version, has_more = db.get_changes_since(session, chat_id, since, limit)
+    changes = []
+    for change, messageDB in deltas:
+        message = None
+        if messageDB is not None:
+            userInDB = messageDB.user
+            messageUser = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
+            message = Message(id=messageDB.id, text=messageDB.text, chat_id=messageDB.chat_id, user=messageUser, created_at=messageDB.created_at)
+        changes.append(ChatChange(
+            version=change.version,
+            type=change.kind if message is not None else "deleted",
+            message_id=change.message_id,
+            message=message,
+        ))
+    return ChangeCollection(
+        meta={"count": len(changes), "version": version, "has_more": has_more},
+        changes=changes,
     )
 
 @chats_router.get(
@@ -156,16 +326,8 @@ def get_msgs(chat_id: int, session: Session = Depends(db.get_session), user: Use
     response_model=UserCollection,
     description="Get users for chat with given chat id.",
 )
-def get_users(chat_id: int, session: Session = Depends(db.get_session), user: UserInDB = Depends(get_current_user)):
-    usersInDB = db.get_users_in_chat(session, chat_id)
-    chatInDB = db.get_chat_by_id(session, chat_id)
-    if user not in chatInDB.users:
-        raise HTTPException(
-            status_code = 403,
-            detail={
-                "error": "no_permission",
-                "error_description": "requires permission to view chat"
-            })
+async def get_users(chat_id: int, session: AsyncSession = Depends(adb.get_session), user: UserInDB = Depends(chat_member)):
+    usersInDB = await adb.get_users_in_chat(session, chat_id)
     users = [User(id=user.id, username=user.username, email=user.email, created_at=user.created_at)
              for user in usersInDB]
     sort_key = lambda user: user.id
@@ -182,23 +344,71 @@ def get_users(chat_id: int, session: Session = Depends(db.get_session), user: Us
 
 @chats_router.put("/{chat_id}/messages/{message_id}", 
                   response_model=MessageResponse,
-                  description="Updates a message with the given message id.",)
+                  description="Updates a message with the given message id.",
+                  dependencies=[Depends(edit_message_limit)],)
 def edit_message(chat_id: int, edited_message: NewMessage, message_id: int, userInDB: UserInDB = Depends(get_current_user),  session: Session = Depends(db.get_session)):
     """Update an chat for a given id."""
 
     msgInDb = db.update_message(session, chat_id, message_id, userInDB.id, edited_message)
-    chatInDb = db.get_chat_by_id(session,chat_id)
-    message_response = Message(id=msgInDb.id, text=edited_message.text, user_id=userInDB.id, chat_id=chat_id, user=userInDB,created_at=msgInDb.created_at,chat=chatInDb)
+    chatInDb = db.get_chat_by_id(session,msgInDb.chat_id)
+    message_response = Message(id=msgInDb.id, text=edited_message.text, user_id=userInDB.id, chat_id=msgInDb.chat_id, user=userInDB,created_at=msgInDb.created_at,chat=chatInDb)
+    hub.publish(msgInDb.chat_id, {
+        "type": "message_updated",
+        "message": message_response.model_dump(mode="json"),
+    })
     return MessageResponse(
         message=message_response
     )
 
 @chats_router.delete("/{chat_id}/messages/{message_id}", 
                     status_code=204,
-                  description="Deletes a message with the given message id.",)
+                  description="Deletes a message with the given message id.",
+                  dependencies=[Depends(edit_message_limit)],)
 def delete_message(chat_id: int, message_id: int, userInDB: UserInDB = Depends(get_current_user),  session: Session = Depends(db.get_session)):
     """Update an chat for a given id."""
 
     db.delete_message(session, chat_id, message_id, userInDB.id)
+    hub.publish(chat_id, {
+        "type": "message_deleted",
+        "message_id": message_id,
+    })
     #chatInDb = db.get_chat_by_id(session,chat_id)
     #message_response = Message(id=msgInDb.id, text=edited_message.text, user_id=userInDB.id, chat_id=chat_id, user=userInDB,created_at=msgInDb.created_at,chat=chatInDb)
+
+
+@chats_router.websocket("/{chat_id}/ws")
+async def chat_socket(
+    websocket: WebSocket,
+    chat_id: int,
+    session: Session = Depends(db.get_session),
+    async_session: AsyncSession = Depends(adb.get_session),
+):
+    """
+    Push message_created, message_updated and message_deleted events for a chat.
+
+    The access token is read from the Authorization header or, since browsers
+    cannot set headers on websockets, from the token query parameter.
+    """
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if token is None and authorization.lower().startswith("bearer "):
+        token = authorization[len("bearer "):]
+
+    try:
+        user = await run_in_threadpool(get_user_from_token, session, token or "")
+    except AuthException:
+        await websocket.close(code=1008)
+        return
+    finally:
+        # don't hold pooled connections for the lifetime of the socket
+        await run_in_threadpool(session.close)
+
+    member = await is_chat_member(async_session, chat_id, user.id)
+    await async_session.close()
+    if not member:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    with hub.subscribe(chat_id) as subscription:
+        await serve(websocket, subscription)
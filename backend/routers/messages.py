@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, Query
+from backend.auth import get_current_user
+from backend.entities import (
+    UserInDB,
+    SearchCollection,
+)
+from backend import async_database as adb
+from backend.serialization import RowSerializer, render
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+messages_router = APIRouter(prefix="/messages", tags=["Messages"])
+
+@messages_router.get(
+    "/search",
+    response_model=SearchCollection,
+    description="Full-text search of messages across the current user's chats.",
+)
+async def search_msgs(
+    q: str = Query(..., pattern=r"\S", description="Search text, with at least one non-space character"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    offset: int = Query(0, ge=0, description="Number of results to skip"),
+    session: AsyncSession = Depends(adb.get_session),
+    user: UserInDB = Depends(get_current_user),
+):
+    messagesInDB = await adb.search_messages(session, q, limit + 1, offset, user_id=user.id)
+    rows = RowSerializer()
+    messages = [rows.message(message) for message in messagesInDB[:limit]]
+    next_offset = offset + limit if len(messagesInDB) > limit else None
+    return render({"meta": {"count": len(messages), "next_offset": next_offset}, "messages": messages})
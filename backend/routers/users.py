@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from datetime import date
 from typing import Literal
 from fastapi.exceptions import HTTPException
@@ -12,9 +12,11 @@ from backend.entities import (
     User,
     ChatCollection,
     ChatInDB,
-    Chat,
 )
+from backend import conditional
 from backend import database as db
+from backend.ratelimit import update_user_limit
+from backend.serialization import RowSerializer, render
 from sqlmodel import Session
 
 users_router = APIRouter(prefix="/users", tags=["Users"])
@@ -23,6 +25,7 @@ users_router = APIRouter(prefix="/users", tags=["Users"])
     "/me",
     response_model=UserResponse,
     description="Update the current user.",
+    dependencies=[Depends(update_user_limit)],
 )
 def update_self(user_update: UserUpdate, user: UserInDB = Depends(get_current_user), session: Session = Depends(db.get_session)):
     updatedUser = db.update_user(session, user, user_update) 
@@ -35,16 +38,18 @@ def update_self(user_update: UserUpdate, user: UserInDB = Depends(get_current_us
                   response_model=UserCollection,
                   description="Get all users",)
 
-def get_users(session: Session = Depends(db.get_session)):
+def get_users(request: Request, response: Response, session: Session = Depends(db.get_session)):
+    etag = conditional.make_etag("users", db.get_users_version(session))
+    if conditional.matches(request, etag):
+        return conditional.not_modified(etag)
+    response.headers.update(conditional.headers(etag))
+
     usersInDB = db.get_all_users(session)
     sort_key = lambda user: user.id
 
-    users = [User(id=user.id, username=user.username, email=user.email, created_at=user.created_at)
-             for user in usersInDB]
-    return UserCollection(
-        meta={"count": len(users)},
-        users=sorted(users, key=sort_key),
-    )
+    rows = RowSerializer()
+    users = [rows.user(user) for user in sorted(usersInDB, key=sort_key)]
+    return render({"meta": {"count": len(users)}, "users": users}, headers=conditional.headers(etag))
 
 
 
@@ -63,8 +68,13 @@ def get_self(user: UserInDB = Depends(get_current_user)):
     response_model=UserResponse,
     description="Get a user for a given user id.",
 )
-def get_user(user_id: int, session: Session = Depends(db.get_session)):
+def get_user(user_id: int, request: Request, response: Response, session: Session = Depends(db.get_session)):
     """Get an user for a given id."""
+    etag = conditional.make_etag("user", user_id, db.get_users_version(session))
+    if conditional.matches(request, etag):
+        return conditional.not_modified(etag)
+    response.headers.update(conditional.headers(etag))
+
     userInDB = db.get_user_by_id(session,user_id)
     userResponse = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
     return UserResponse(user = userResponse)
@@ -79,17 +89,10 @@ def get_user(user_id: int, session: Session = Depends(db.get_session)):
 def get_user_chats(user_id: int, session: Session = Depends(db.get_session)):
     chatsInDB = db.get_chats_with_user(session, user_id)
     sort_key = lambda chat: chat.name
-    
-    chats_response = []
-    for chat in chatsInDB:
-        owner = get_user(chat.owner.id,session)
-        chat_response = Chat(id=chat.id, name=chat.name, owner=owner.user, created_at=chat.created_at)
-        chats_response.append(chat_response)
-
-    return ChatCollection(
-        meta={"count": len(chats_response)},
-        chats=sorted(chats_response, key=sort_key),
-    )
+
+    rows = RowSerializer()
+    chats = [rows.chat(chat) for chat in sorted(chatsInDB, key=sort_key)]
+    return render({"meta": {"count": len(chats)}, "chats": chats})
 
 
 
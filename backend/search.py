@@ -0,0 +1,127 @@
+from sqlalchemy import DDL, event, func, literal_column, select, text, union_all
+from sqlalchemy.sql import column, table
+
+from backend.entities import ArchivedMessageInDB, MessageInDB
+
+# SQLite: external-content FTS5 indexes over messages.text and
+# archived_messages.text, kept in sync by triggers, so every write path
+# (add_message, update_message, delete_message, archival and the seeder)
+# maintains them without extra round trips.
+def _sqlite_ddl(table: str) -> list[str]:
+    fts = f"{table}_fts"
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            text, content='{table}', content_rowid='id', tokenize='porter unicode61'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF text ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+        END
+        """,
+    ]
+
+
+# Postgres: GIN expression indexes, which the planner maintains on every write
+def _postgresql_ddl(table: str) -> list[str]:
+    return [
+        f"""
+        CREATE INDEX IF NOT EXISTS ix_{table}_text_tsv
+        ON {table} USING gin (to_tsvector('english', text))
+        """,
+    ]
+
+
+# archived messages stay searchable: the archival insert indexes them in
+# archived_messages_fts as its delete drops them from messages_fts
+models = (MessageInDB, ArchivedMessageInDB)
+
+for model in models:
+    for statement in _sqlite_ddl(model.__tablename__):
+        event.listen(model.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    for statement in _postgresql_ddl(model.__tablename__):
+        event.listen(model.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+def create_search_index(connection):
+    """
+    Create the search indexes on existing message tables and backfill them.
+
+    Tables made by create_all get the indexes from the after_create hooks above.
+    """
+    dialect = connection.dialect.name
+    for model in models:
+        table = model.__tablename__
+        if dialect == "sqlite":
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": f"{table}_fts"}
+            ).first()
+            for statement in _sqlite_ddl(table):
+                connection.execute(text(statement))
+            if not exists:
+                connection.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for statement in _postgresql_ddl(table):
+                connection.execute(text(statement))
+
+
+def _fts5_query(query: str) -> str:
+    # quote every term so user input can't hit FTS5 query syntax
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def _ranked(dialect: str, model, query: str, chat_ids):
+    # (id, rank) of the matches in one tier; lower rank is better
+    if isinstance(chat_ids, int):
+        chat_filter = model.chat_id == chat_ids
+    else:
+        chat_filter = model.chat_id.in_(chat_ids)
+
+    if dialect == "sqlite":
+        fts = f"{model.__tablename__}_fts"
+        index = table(fts, column("rowid"))
+        # bm25 is lower for better matches
+        rank = func.bm25(literal_column(fts))
+        return (
+            select(model.id, rank.label("rank"))
+            .join_from(model, index, index.c.rowid == model.id)
+            .where(text(f"{fts} MATCH :{fts}_query").bindparams(**{f"{fts}_query": _fts5_query(query)}))
+            .where(chat_filter)
+        )
+    document = func.to_tsvector("english", model.text)
+    tsquery = func.websearch_to_tsquery("english", query)
+    return (
+        select(model.id, (-func.ts_rank(document, tsquery)).label("rank"))
+        .where(document.op("@@")(tsquery))
+        .where(chat_filter)
+    )
+
+
+def search_query(dialect: str, query: str, chat_ids, limit: int, offset: int):
+    """
+    Build a ranked full-text search over hot and archived messages.
+
+    :param dialect: "sqlite" or "postgresql"
+    :param query: the user's search text
+    :param chat_ids: chat id, or a subquery of chat ids, to search in
+    :return: select of message ids, best match first
+    """
+    ranked = union_all(*(_ranked(dialect, model, query, chat_ids) for model in models)).subquery()
+    return (
+        select(ranked.c.id)
+        .order_by(ranked.c.rank, ranked.c.id)
+        .limit(limit)
+        .offset(offset)
+    )
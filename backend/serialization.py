@@ -0,0 +1,53 @@
+from typing import Optional
+
+from fastapi.responses import ORJSONResponse
+
+# List endpoints build plain dicts straight from the loaded rows and encode
+# them with orjson, instead of building a pydantic model per row that FastAPI
+# then validates and serializes again through response_model. The
+# response_model on those routes still documents the shape; the tests check
+# both paths produce the same JSON. See benchmarks/serialization.py.
+
+
+class RowSerializer:
+    """
+    Turns ORM rows into response dicts, building each user's dict once per
+    response since the same authors appear on many messages.
+    """
+
+    def __init__(self):
+        self._users = {}
+
+    def user(self, user) -> dict:
+        data = self._users.get(user.id)
+        if data is None:
+            data = self._users[user.id] = {
+                "id": user.id,
+                "username": user.username,
+                "email": user.email,
+                "created_at": user.created_at,
+            }
+        return data
+
+    def message(self, message) -> dict:
+        return {
+            "id": message.id,
+            "text": message.text,
+            "chat_id": message.chat_id,
+            "user": self.user(message.user),
+            "created_at": message.created_at,
+        }
+
+    def chat(self, chat, **extra) -> dict:
+        return {
+            "id": chat.id,
+            "name": chat.name,
+            "owner": self.user(chat.owner),
+            "created_at": chat.created_at,
+            **extra,
+        }
+
+
+def render(content: dict, headers: Optional[dict[str, str]] = None, status_code: int = 200) -> ORJSONResponse:
+    """Encode a response body built from plain dicts, skipping response_model."""
+    return ORJSONResponse(content, status_code=status_code, headers=headers)
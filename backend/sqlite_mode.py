@@ -0,0 +1,94 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+from sqlmodel import Session
+
+from backend import pooling
+
+# Concurrent SQLite: every connection runs in WAL mode, so readers never
+# block behind the writer. Reads go through the usual connection pool and
+# writes through a writer engine with a single connection, whose pool is
+# the queue writers wait in. Sync and async code each have their own
+# writer; busy_timeout covers the rare overlap between the two.
+
+enabled = os.environ.get("SQLITE_CONCURRENT", default="true").lower() == "true"
+busy_timeout = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", default="5000"))
+mmap_size = int(os.environ.get("SQLITE_MMAP_SIZE", default=str(256 * 1024 * 1024)))  # bytes
+synchronous = os.environ.get("SQLITE_SYNCHRONOUS", default="NORMAL")
+# longest a write waits for the writer connection
+write_timeout = float(os.environ.get("SQLITE_WRITE_TIMEOUT", default="30"))  # seconds
+
+
+def pragmas() -> list[str]:
+    return [
+        "PRAGMA journal_mode = WAL",
+        f"PRAGMA synchronous = {synchronous}",
+        f"PRAGMA busy_timeout = {busy_timeout}",
+        f"PRAGMA mmap_size = {mmap_size}",
+    ]
+
+
+def apply_pragmas(engine):
+    """
+    Configure every new connection of an engine for concurrent use.
+
+    :param engine: a sync Engine (use .sync_engine for async engines)
+    """
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def writer_pool_options(is_async: bool = False) -> dict:
+    """Keyword arguments for a writer engine: one connection, waited for in turn."""
+    return {
+        "poolclass": pooling.InstrumentedAsyncQueuePool if is_async else pooling.InstrumentedQueuePool,
+        "pool_size": 1,
+        "max_overflow": 0,
+        "pool_timeout": write_timeout,
+    }
+
+
+class RoutingSession(Session):
+    """
+    Session that reads through its bind and sends writes to the writer.
+
+    Once a transaction has written, everything else in it goes to the writer
+    as well, so it reads its own uncommitted changes. Without a writer it is
+    an ordinary session.
+    """
+
+    def __init__(self, bind=None, *, writer=None, **kwargs):
+        super().__init__(bind=bind, **kwargs)
+        self.writer = writer
+        self._writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.writer is not None and (self._writing or self._flushing or isinstance(clause, UpdateBase)):
+            self._writing = True
+            return self.writer
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self._writing = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._writing = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._writing = False
+
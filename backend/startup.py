@@ -0,0 +1,48 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# fast start: skip work a warm, already-migrated deployment doesn't need
+fast_start = os.environ.get(
+    "FAST_START",
+    default="true" if "AWS_LAMBDA_FUNCTION_NAME" in os.environ else "false",
+).lower() == "true"
+
+# schema DDL at startup; off in fast start unless explicitly requested
+create_tables = os.environ.get(
+    "DB_CREATE_TABLES",
+    default="false" if fast_start else "true",
+).lower() == "true"
+
+_phases: dict[str, float] = {}
+_lock = threading.Lock()
+
+
+@contextmanager
+def timed(phase: str):
+    """Record how long a block of startup work takes."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def report() -> dict[str, float]:
+    """Seconds spent in each recorded startup phase."""
+    with _lock:
+        return dict(_phases)
+
+
+def record(phase: str, seconds: float):
+    with _lock:
+        _phases[phase] = _phases.get(phase, 0.0) + seconds
+
+
+def log_report():
+    for phase, seconds in report().items():
+        logger.info("startup %s: %.1f ms", phase, seconds * 1000)
@@ -0,0 +1,54 @@
+import json
+import subprocess
+import sys
+
+
+def import_breakdown(module: str = "backend.main") -> tuple[list[tuple[str, int, int]], dict]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    :return: ([(module, self us, cumulative us)], startup phases of the child)
+    """
+    code = (
+        f"import json, {module}; from backend import startup; "
+        "print(json.dumps(startup.report()))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    return modules, phases
+
+
+def main(top: int = 25):
+    """Print the import and init cost of backend.main: python -m backend.startup_report [top]"""
+    modules, phases = import_breakdown()
+
+    # attribute self time to top-level packages
+    packages: dict[str, int] = {}
+    for name, self_us, _ in modules:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    print("init phases (ms)")
+    for phase, seconds in phases.items():
+        print(f"  {seconds * 1000:10.1f}  {phase}")
+    print(f"\nimport self time by package (ms), top {top}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {self_us / 1000:10.1f}  {package}")
+    print(f"\nslowest modules by cumulative import time (ms), top {top}")
+    for name, _, cumulative_us in sorted(modules, key=lambda item: -item[2])[:top]:
+        print(f"  {cumulative_us / 1000:10.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 25)
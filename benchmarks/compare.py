@@ -0,0 +1,52 @@
+"""
+Compare two benchmarks.load result files, e.g. from two commits.
+
+    python -m benchmarks.compare base.json new.json
+
+Latency changes are new relative to base, so negative is faster; for
+throughput positive is better.
+"""
+import argparse
+import json
+from pathlib import Path
+
+
+def change(base: float, new: float) -> str:
+    if not base:
+        return "n/a"
+    return f"{(new - base) / base * 100:+.1f}%"
+
+
+def main(base: dict, new: dict):
+    print(f"base: {base['commit'][:10]}{' (dirty)' if base['dirty'] else ''}  {base['created_at']}")
+    print(f"new:  {new['commit'][:10]}{' (dirty)' if new['dirty'] else ''}  {new['created_at']}")
+    differing = sorted(
+        key for key in base["params"].keys() | new["params"].keys()
+        if base["params"].get(key) != new["params"].get(key)
+    )
+    if differing:
+        print(f"warning: runs used different parameters: {', '.join(differing)}")
+
+    print(f"\n{'throughput':<16}{base['throughput_rps']:>10}{new['throughput_rps']:>10}"
+          f"{change(base['throughput_rps'], new['throughput_rps']):>10}  req/s")
+    print(f"\n{'operation':<16}{'':<6}{'base':>10}{'new':>10}{'change':>10}  (ms)")
+    rows = [("all", base["latency_ms"], new["latency_ms"])] + [
+        (name, base["operations"][name]["latency_ms"], new["operations"][name]["latency_ms"])
+        for name in base["operations"]
+        if name in new["operations"]
+    ]
+    for name, before, after in rows:
+        if not before["count"] or not after["count"]:
+            continue
+        for percentile in ("p50", "p95", "p99"):
+            label = name if percentile == "p50" else ""
+            print(f"{label:<16}{percentile:<6}{before[percentile]:>10}{after[percentile]:>10}"
+                  f"{change(before[percentile], after[percentile]):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base", type=Path)
+    parser.add_argument("new", type=Path)
+    args = parser.parse_args()
+    main(json.loads(args.base.read_text()), json.loads(args.new.read_text()))
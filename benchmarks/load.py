@@ -0,0 +1,383 @@
+"""
+Load test of the API under realistic workloads, reporting p50/p95/p99 latency
+and throughput per operation and saving the results as JSON.
+
+Requests go to backend.main.app either in process (httpx over ASGI) or
+through a local uvicorn server. Each run seeds a fresh SQLite database and
+drives it with a fixed number of requests from seeded random generators, so
+runs with the same arguments are comparable across commits:
+
+    python -m benchmarks.load --workload mixed --mode inprocess
+    python -m benchmarks.load --workload mixed --mode uvicorn --output new.json
+    python -m benchmarks.compare old.json new.json
+
+Workloads: login, chats, messages (paging through history), post, edit, and
+mixed (reads and writes in the ratio given by --write-ratio). Rate limiting
+is disabled, since every request comes from a handful of seeded users.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+password = "benchmark-password"
+results_dir = Path(__file__).parent / "results"
+
+
+@dataclass
+class VirtualUser:
+    id: int
+    username: str
+    headers: dict[str, str]
+    chats: list[int]
+    authored: list[tuple[int, int]]  # (chat id, message id)
+    cursors: dict[int, str] = field(default_factory=dict)  # chat id -> older page
+
+
+def seed_database(users: int, chats: int, members: int, messages: int, seed: int) -> list[VirtualUser]:
+    """
+    Fill the database at SQLITE_PATH: chats with `members` random members
+    each and `messages` messages per chat, spread over the past year.
+    """
+    from sqlalchemy import insert
+    from sqlmodel import Session, select
+
+    from backend import database as db
+    from backend.auth import _build_access_token
+    from backend.entities import ChatInDB, MessageInDB, UserChatLinkInDB, UserInDB
+    from backend.passwords import password_hasher
+
+    rng = random.Random(seed)
+    db.create_db_and_tables()
+    engine = db.get_engine()
+    start = datetime.now() - timedelta(days=365)
+    hashed_password = password_hasher.context.hash(password)
+
+    user_rows = [
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com",
+         "hashed_password": hashed_password, "created_at": start}
+        for i in range(1, users + 1)
+    ]
+    chat_rows, link_rows, message_rows = [], [], []
+    memberships = {i: [] for i in range(1, users + 1)}
+    authored = {i: [] for i in range(1, users + 1)}
+    message_id = 0
+    for chat_id in range(1, chats + 1):
+        chat_members = rng.sample(range(1, users + 1), min(members, users))
+        chat_rows.append({"id": chat_id, "name": f"chat {chat_id}", "owner_id": chat_members[0], "created_at": start})
+        for user_id in chat_members:
+            link_rows.append({"user_id": user_id, "chat_id": chat_id})
+            memberships[user_id].append(chat_id)
+        at = start
+        for _ in range(messages):
+            # bursts of conversation separated by longer pauses
+            at += timedelta(seconds=rng.expovariate(1 / 60) if rng.random() < 0.8 else rng.expovariate(1 / 7200))
+            message_id += 1
+            author = rng.choice(chat_members)
+            message_rows.append({
+                "id": message_id, "text": f"message {message_id} " + "lorem ipsum " * rng.randint(1, 12),
+                "user_id": author, "chat_id": chat_id, "created_at": at,
+            })
+            authored[author].append((chat_id, message_id))
+
+    with engine.begin() as connection:
+        connection.execute(insert(UserInDB), user_rows)
+        connection.execute(insert(ChatInDB), chat_rows)
+        connection.execute(insert(UserChatLinkInDB), link_rows)
+        connection.execute(insert(MessageInDB), message_rows)
+    with Session(engine) as session:
+        db.repair_chat_stats(session)
+        user_list = session.exec(select(UserInDB).order_by(UserInDB.id)).all()
+        tokens = {user.id: _build_access_token(user).access_token for user in user_list}
+    engine.dispose()
+
+    return [
+        VirtualUser(
+            id=user_id,
+            username=f"user{user_id}",
+            headers={"Authorization": f"Bearer {tokens[user_id]}"},
+            chats=memberships[user_id],
+            authored=authored[user_id],
+        )
+        for user_id in range(1, users + 1)
+        if memberships[user_id]
+    ]
+
+
+async def login(client: httpx.AsyncClient, user: VirtualUser, _rng: random.Random) -> httpx.Response:
+    return await client.post("/auth/token", data={"username": user.username, "password": password})
+
+
+async def list_chats(client: httpx.AsyncClient, user: VirtualUser, _rng: random.Random) -> httpx.Response:
+    return await client.get("/chats", headers=user.headers)
+
+
+async def page_messages(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    # scroll back through a chat's history, starting over at the newest page
+    chat_id = rng.choice(user.chats)
+    params = {"limit": 50}
+    if chat_id in user.cursors:
+        params["before"] = user.cursors[chat_id]
+    response = await client.get(f"/chats/{chat_id}/messages", params=params, headers=user.headers)
+    if response.status_code == 200 and response.json()["meta"]["prev_cursor"]:
+        user.cursors[chat_id] = response.json()["meta"]["prev_cursor"]
+    else:
+        user.cursors.pop(chat_id, None)
+    return response
+
+
+async def post_message(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    chat_id = rng.choice(user.chats)
+    response = await client.post(
+        f"/chats/{chat_id}/messages",
+        json={"text": "benchmark " + "lorem ipsum " * rng.randint(1, 12)},
+        headers=user.headers,
+    )
+    if response.status_code == 201:
+        user.authored.append((chat_id, response.json()["message"]["id"]))
+    return response
+
+
+async def edit_message(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    if not user.authored:
+        return await post_message(client, user, rng)
+    chat_id, message_id = rng.choice(user.authored)
+    return await client.put(
+        f"/chats/{chat_id}/messages/{message_id}",
+        json={"text": "edited " + "lorem ipsum " * rng.randint(1, 12)},
+        headers=user.headers,
+    )
+
+
+operations = {
+    "login": login,
+    "list_chats": list_chats,
+    "page_messages": page_messages,
+    "post_message": post_message,
+    "edit_message": edit_message,
+}
+
+
+def workload_mix(workload: str, write_ratio: float) -> dict[str, float]:
+    """Relative weight of each operation in a workload."""
+    if workload == "mixed":
+        read, write = 1 - write_ratio, write_ratio
+        return {
+            "list_chats": read * 0.25,
+            "page_messages": read * 0.75,
+            "post_message": write * 0.8,
+            "edit_message": write * 0.2,
+        }
+    return {
+        "login": {"login": 1.0},
+        "chats": {"list_chats": 1.0},
+        "messages": {"page_messages": 1.0},
+        "post": {"post_message": 1.0},
+        "edit": {"edit_message": 1.0},
+    }[workload]
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    users: list[VirtualUser],
+    mix: dict[str, float],
+    requests: int,
+    concurrency: int,
+    seed: int,
+) -> tuple[float, dict[str, list[float]], dict[str, Counter]]:
+    """
+    Issue `requests` requests from `concurrency` workers, each picking
+    operations from the mix with its own seeded generator.
+
+    :return: (elapsed seconds, latencies by operation, status codes by operation)
+    """
+    names, weights = zip(*((name, weight) for name, weight in mix.items() if weight > 0))
+    latencies = {name: [] for name in names}
+    statuses = {name: Counter() for name in names}
+    remaining = requests
+
+    async def worker(index: int):
+        nonlocal remaining
+        rng = random.Random(seed * 1_000_003 + index)
+        user = users[index % len(users)]
+        while remaining > 0:
+            remaining -= 1
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            response = await operations[name](client, user, rng)
+            latencies[name].append(time.perf_counter() - start)
+            statuses[name][response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    """Latency percentiles in milliseconds, nearest-rank."""
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+
+    def percentile(q: float) -> float:
+        return round(ordered[max(0, math.ceil(q * len(ordered)) - 1)] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+def git_revision() -> tuple[str, bool]:
+    """(commit, whether tracked files have uncommitted changes)"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(status.strip())
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    """Run uvicorn on the benchmark database and wait until it answers."""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {server.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+
+async def run(args, users: list[VirtualUser]):
+    mix = workload_mix(args.workload, args.write_ratio)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.mode == "inprocess":
+        from backend import async_database as adb
+        from backend import database as db
+        from backend.main import app
+
+        # count unhandled errors as 500s, as a server would, instead of aborting
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", limits=limits) as client:
+            result = await drive(client, users, mix, args.requests, args.concurrency, args.seed)
+        await adb.dispose_engine()
+        db.get_engine().dispose()
+        return result
+
+    port = free_port()
+    server = start_server(port, args.workers)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            return await drive(client, users, mix, args.requests, args.concurrency, args.seed)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="pony-benchmark-", ignore_cleanup_errors=True) as workdir:
+        # must be set before backend is imported, here and in the uvicorn child
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "benchmark.db")
+        os.environ["QUERY_LOG_PATH"] = os.path.join(workdir, "queries.log")
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+        users = seed_database(args.users, args.chats, args.members, args.messages, args.seed)
+        elapsed, latencies, statuses = asyncio.run(run(args, users))
+
+        from backend import querylog
+        querylog.sink.flush()
+
+    commit, dirty = git_revision()
+    every_latency = [latency for values in latencies.values() for latency in values]
+    errors = sum(count for counter in statuses.values() for status, count in counter.items() if status >= 400)
+    return {
+        "benchmark": "load",
+        "workload": args.workload,
+        "mode": args.mode,
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(every_latency) / elapsed, 1),
+        "errors": errors,
+        "latency_ms": summarize(every_latency),
+        "operations": {
+            name: {
+                "statuses": {str(status): count for status, count in sorted(statuses[name].items())},
+                "latency_ms": summarize(values),
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+
+def print_report(result: dict):
+    print(f"{result['workload']} ({result['mode']}) at {result['commit'][:10]}{' (dirty)' if result['dirty'] else ''}")
+    print(f"  {result['latency_ms']['count']} requests in {result['elapsed_seconds']} s: "
+          f"{result['throughput_rps']} req/s, {result['errors']} errors")
+    print(f"  {'operation':<16}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    rows = [("all", result["latency_ms"])] + [(name, op["latency_ms"]) for name, op in result["operations"].items()]
+    for name, summary in rows:
+        if summary["count"]:
+            print(f"  {name:<16}{summary['count']:>8}{summary['p50']:>10}{summary['p95']:>10}{summary['p99']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workload", choices=["login", "chats", "messages", "post", "edit", "mixed"], default="mixed")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of writes in the mixed workload")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--members", type=int, default=10, help="members per chat")
+    parser.add_argument("--messages", type=int, default=500, help="messages per chat")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/<workload>-<mode>-<commit>.json)")
+    args = parser.parse_args()
+
+    result = main(args)
+    print_report(result)
+    output = args.output or results_dir / f"{result['workload']}-{result['mode']}-{result['commit'][:10]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"saved {output}")
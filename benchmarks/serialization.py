@@ -0,0 +1,93 @@
+"""
+Serialization cost of a messages list response, per 10k messages.
+
+Compares the old path (a pydantic User/Message per row, wrapped in
+MsgCollection, then validated and serialized again by FastAPI through
+response_model) with backend.serialization (dicts from rows, encoded by
+orjson). No database is involved; rows are built in memory.
+
+    python -m benchmarks.serialization [--messages 10000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from backend.entities import Message, MessageInDB, MsgCollection, User, UserInDB
+from backend.serialization import RowSerializer, render
+
+
+def build_rows(count: int, authors: int = 20) -> list[MessageInDB]:
+    start = datetime(2024, 1, 1)
+    users = [
+        UserInDB(id=i, username=f"user{i}", email=f"user{i}@example.com", hashed_password="x", created_at=start)
+        for i in range(authors)
+    ]
+    return [
+        MessageInDB(
+            id=i,
+            text=f"message number {i} with a little text in it",
+            chat_id=1,
+            user=users[i % authors],
+            created_at=start + timedelta(seconds=i, microseconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+response_field = create_response_field(name="response", type_=MsgCollection)
+
+
+def pydantic_path(rows: list[MessageInDB]) -> bytes:
+    messages = []
+    for messageDB in rows:
+        userInDB = messageDB.user
+        messageUser = User(id=userInDB.id, username=userInDB.username, email=userInDB.email, created_at=userInDB.created_at)
+        messages.append(Message(id=messageDB.id, text=messageDB.text, chat_id=messageDB.chat_id, user=messageUser, created_at=messageDB.created_at))
+    collection = MsgCollection(
+        meta={"count": len(messages), "prev_cursor": None, "next_cursor": None},
+        messages=messages,
+    )
+    content = asyncio.run(serialize_response(field=response_field, response_content=collection))
+    return JSONResponse(content).body
+
+
+def fast_path(rows: list[MessageInDB]) -> bytes:
+    serializer = RowSerializer()
+    messages = [serializer.message(message) for message in rows]
+    return render({
+        "meta": {"count": len(messages), "prev_cursor": None, "next_cursor": None},
+        "messages": messages,
+    }).body
+
+
+def best_of(fn, rows, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(messages: int, repeat: int):
+    rows = build_rows(messages)
+    scale = 10_000 / messages
+    results = {name: best_of(fn, rows, repeat) * scale for name, fn in
+               (("pydantic + response_model", pydantic_path), ("rows + orjson", fast_path))}
+    for name, seconds in results.items():
+        print(f"{name:>26}: {seconds * 1000:8.1f} ms per 10k messages")
+    baseline, fast = results.values()
+    print(f"{'speedup':>26}: {baseline / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.messages, args.repeat)
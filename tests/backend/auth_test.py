@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from backend import database as db
+from backend.entities import UserInDB
+from backend.passwords import HasherBusy, PasswordHasher, build_context
+
+
+@pytest.fixture
+def fast_hasher(monkeypatch):
+    hasher = PasswordHasher(build_context(5), max_workers=1)
+    monkeypatch.setattr("backend.auth.password_hasher", hasher)
+    return hasher
+
+
+def test_register_and_login(client, fast_hasher):
+    registration = {"username": "neo", "email": "neo@example.com", "password": "matrix"}
+    response = client.post("/auth/registration", json=registration)
+    assert response.status_code == 201
+    assert response.json()["user"]["username"] == "neo"
+
+    response = client.post("/auth/registration", json=registration)
+    assert response.status_code == 422
+    assert response.json()["detail"]["entity_field"] == "email"
+
+    response = client.post("/auth/token", data={"username": "neo", "password": "matrix"})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "Bearer"
+
+    response = client.post("/auth/token", data={"username": "neo", "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_rehashes_on_cost_change(client, session, fast_hasher):
+    user = UserInDB(
+        username="trinity",
+        email="trinity@example.com",
+        hashed_password=build_context(4).hash("matrix"),
+    )
+    session.add(user)
+    session.commit()
+    version = db.get_users_version(session)
+
+    response = client.post("/auth/token", data={"username": "trinity", "password": "matrix"})
+    assert response.status_code == 200
+    session.refresh(user)
+    assert user.hashed_password.startswith("$2b$05$")
+    # no public field changed, so cached user and chat reads stay valid
+    assert db.get_users_version(session) == version
+
+
+def test_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(build_context(4), max_workers=1, max_pending=1, queue_timeout=0.01)
+
+    async def saturate():
+        return await asyncio.gather(
+            hasher.hash("one"), hasher.hash("two"), return_exceptions=True,
+        )
+
+    results = asyncio.run(saturate())
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], HasherBusy)
+    assert results[1].status_code == 503
@@ -0,0 +1,62 @@
+from sqlalchemy import func, text
+from sqlmodel import SQLModel, create_engine, select
+
+from backend import datagen
+from backend.entities import ChatInDB, MessageInDB, UserChatLinkInDB, UserInDB
+
+shape = datagen.Shape(users=50, chats=12, messages=900, seed=7, max_members=20, days=30)
+
+
+def message_rows(engine):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(MessageInDB.id, MessageInDB.text, MessageInDB.user_id, MessageInDB.chat_id, MessageInDB.created_at)
+            .order_by(MessageInDB.id)
+        ).all()
+
+
+def test_generate_loads_consistent_data(engine, session, monkeypatch):
+    # several segments per chat, generated out of process
+    monkeypatch.setattr(datagen, "batch_size", 100)
+
+    result = datagen.generate(shape, engine, processes=2)
+    assert {table: counts["rows"] for table, counts in result.items()} == {
+        "users": 50, "chats": 12, "links": session.exec(select(func.count(UserChatLinkInDB.user_id))).one(),
+        "messages": 900,
+    }
+
+    chats = session.exec(select(ChatInDB)).all()
+    assert sum(chat.message_count for chat in chats) == 900
+    for chat in chats:
+        assert 2 <= chat.member_count <= 20
+        members = set(session.exec(select(UserChatLinkInDB.user_id).where(UserChatLinkInDB.chat_id == chat.id)).all())
+        assert chat.owner_id in members
+        messages = session.exec(select(MessageInDB).where(MessageInDB.chat_id == chat.id).order_by(MessageInDB.id)).all()
+        assert {message.user_id for message in messages} <= members
+        # ids follow time within a chat, as keyset paging and the inbox expect
+        assert [message.created_at for message in messages] == sorted(message.created_at for message in messages)
+        assert all(chat.created_at <= message.created_at <= shape.end for message in messages)
+
+    # the search index was rebuilt for the loaded messages
+    word = session.exec(select(MessageInDB.text)).first().split()[0]
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM messages_fts WHERE messages_fts MATCH :word"), {"word": word}).scalar() > 0
+
+
+def test_generate_is_deterministic_and_appends(tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(datagen, "batch_size", 100)
+    other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    SQLModel.metadata.create_all(other)
+
+    datagen.generate(shape, engine, processes=1)
+    datagen.generate(shape, other, processes=2)
+    assert message_rows(engine) == message_rows(other)
+
+    # a second run keeps existing rows and continues after their ids
+    datagen.generate(shape, other, processes=1)
+    rows = message_rows(other)
+    assert len(rows) == 1800
+    assert rows[900].id == 901
+    with other.connect() as connection:
+        assert connection.scalar(select(func.count(UserInDB.id))) == 100
+    other.dispose()
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from backend import db_seeder
+from backend.entities import ChatInDB, MessageInDB, UserInDB
+
+
+def test_seed_database_streams_batches_and_is_idempotent(tmp_path, engine, session, monkeypatch):
+    source = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    SQLModel.metadata.create_all(source)
+    with Session(source) as source_session:
+        owner = UserInDB(username="owner", email="owner@example.com", hashed_password="x")
+        chat = ChatInDB(name="chat", owner=owner, users=[owner])
+        source_session.add(chat)
+        source_session.commit()
+        source_session.add_all(
+            MessageInDB(text=f"message {i}", user_id=owner.id, chat_id=chat.id, created_at=datetime(2024, 1, 1, 0, i))
+            for i in range(7)
+        )
+        source_session.commit()
+    monkeypatch.setattr(db_seeder, "batch_size", 3)
+
+    result = db_seeder.seed_database(source=source, target=engine)
+    assert result["message_count"] == {"local": 7, "prev": 0, "additions": 7, "final": 7}
+    assert result["link_count"]["additions"] == 1
+
+    result = db_seeder.seed_database(source=source, target=engine)
+    assert result["message_count"] == {"local": 7, "prev": 7, "additions": 0, "final": 7}
+
+    chat = session.exec(select(ChatInDB)).one()
+    assert (chat.message_count, chat.member_count) == (7, 1)
+    assert chat.last_message_at == datetime(2024, 1, 1, 0, 6)
+    source.dispose()
+
+
+def test_seeding_invalidates_cached_reads(tmp_path, engine, session, client, auth_headers):
+    source = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    SQLModel.metadata.create_all(source)
+    with Session(source) as source_session:
+        owner = UserInDB(username="owner", email="owner@example.com", hashed_password="x")
+        chat = ChatInDB(name="chat", owner=owner, users=[owner])
+        source_session.add(chat)
+        source_session.commit()
+        chat_id, owner_id = chat.id, owner.id
+    db_seeder.seed_database(source=source, target=engine)
+
+    headers = auth_headers(session.get(UserInDB, owner_id))
+    chat_etag = client.get(f"/chats/{chat_id}", headers=headers).headers["etag"]
+    users_etag = client.get("/users").headers["etag"]
+
+    with Session(source) as source_session:
+        source_session.add(UserInDB(username="late", email="late@example.com", hashed_password="x"))
+        source_session.add(MessageInDB(text="new", user_id=owner_id, chat_id=chat_id))
+        source_session.commit()
+    db_seeder.seed_database(source=source, target=engine)
+
+    response = client.get(f"/chats/{chat_id}", headers={**headers, "If-None-Match": chat_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != chat_etag
+    assert response.json()["meta"]["message_count"] == 1
+    response = client.get("/users", headers={"If-None-Match": users_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != users_etag
+    source.dispose()
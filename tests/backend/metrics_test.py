@@ -0,0 +1,35 @@
+from backend import metrics
+from backend.entities import ChatInDB, UserInDB
+
+
+def test_metrics_report_route_latency_and_db_work(client, session, async_engine, auth_headers, monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+    metrics.instrument(async_engine.sync_engine)
+    user = UserInDB(username="observer", email="observer@example.com", hashed_password="x")
+    chat = ChatInDB(name="chat", owner=user, users=[user])
+    session.add(chat)
+    session.commit()
+    chat_id = chat.id
+    headers = auth_headers(user)
+
+    assert client.get(f"/chats/{chat_id}", headers=headers).status_code == 200
+    assert client.get("/chats/999", headers=headers).status_code == 404
+    assert client.get("/no/such/path").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+
+    # routes are labelled by template, not by the requested path
+    assert 'http_requests_total{method="GET",route="/chats/{chat_id}",status="200"} 1' in lines
+    assert 'http_requests_total{method="GET",route="/chats/{chat_id}",status="404"} 1' in lines
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/chats/{chat_id}"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/chats/{chat_id}",le="+Inf"} 2' in lines
+
+    statements = next(line for line in lines if line.startswith('db_statements_total{route="/chats/{chat_id}"}'))
+    assert int(statements.split()[-1]) >= 2
+    db_time = next(line for line in lines if line.startswith('db_time_seconds_total{route="/chats/{chat_id}"}'))
+    assert float(db_time.split()[-1]) > 0
+    assert 'cache_entries{cache="membership"} 1' in lines
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from backend import pooling
+from backend.pooling import InstrumentedQueuePool
+
+
+def test_instrumented_pool_tracks_usage_and_waits(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    stats = pooling.instrument(engine, "test")
+
+    with engine.connect():
+        assert stats.snapshot()["in_use"] == 1
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    snapshot = stats.snapshot()
+    assert snapshot["in_use"] == 0
+    assert snapshot["checkouts"] == 1
+    assert snapshot["timeouts"] == 1
+    assert snapshot["max_wait_seconds"] >= 0.05
+
+    engine.dispose()
+    assert engine.pool.stats is stats
+    pooling.pool_stats.pop("test")
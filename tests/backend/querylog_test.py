@@ -0,0 +1,81 @@
+import time
+
+import orjson
+from sqlalchemy import create_engine, text
+
+from backend import querylog
+from backend.entities import ChatInDB, UserInDB
+
+
+def test_normalize_groups_statements_by_shape():
+    assert querylog.normalize(
+        "SELECT *\n  FROM messages WHERE chat_id = 42 AND text = 'it''s' AND id IN (?, ?, ?)"
+    ) == "SELECT * FROM messages WHERE chat_id = ? AND text = ? AND id IN (?...)"
+    assert querylog.normalize("SELECT anon_1.id FROM t WHERE id = $1 LIMIT 10") == (
+        "SELECT anon_1.id FROM t WHERE id = $1 LIMIT ?"
+    )
+    assert querylog.normalize("INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)") == (
+        "INSERT INTO t (a, b) VALUES (?...), (?...)"
+    )
+
+
+def test_sampled_and_slow_statements_are_logged(monkeypatch):
+    written = []
+    sink = querylog.BufferedSink(written.append, maxsize=2, background=False)
+    monkeypatch.setattr(querylog, "sink", sink)
+    engine = create_engine("sqlite://")
+    querylog.instrument(engine)
+
+    monkeypatch.setattr(querylog, "sample_rate", 0.0)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    sink.flush()
+    assert written == []
+
+    monkeypatch.setattr(querylog, "slow_threshold", 0.0)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT :x"), {"x": "secret"})
+        connection.execute(text("SELECT :x"), {"x": "secret"})
+        connection.execute(text("SELECT :x"), {"x": "other"})
+    # the oldest record is dropped once the buffer is full
+    assert sink.dropped == 1
+    sink.flush()
+
+    records = [orjson.loads(line) for line in b"".join(written).splitlines()]
+    assert [record["statement"] for record in records] == ["SELECT ?", "SELECT ?"]
+    assert records[0]["slow"] is True
+    assert records[0]["params"] != records[1]["params"]
+    assert "secret" not in written[0].decode()
+    assert records[0]["route"] is None
+    engine.dispose()
+
+
+def test_records_carry_the_route(client, session, async_engine, auth_headers, monkeypatch):
+    written = []
+    sink = querylog.BufferedSink(written.append, background=False)
+    monkeypatch.setattr(querylog, "sink", sink)
+    monkeypatch.setattr(querylog, "sample_rate", 1.0)
+    querylog.instrument(async_engine.sync_engine)
+    user = UserInDB(username="logged", email="logged@example.com", hashed_password="x")
+    chat = ChatInDB(name="chat", owner=user, users=[user])
+    session.add(chat)
+    session.commit()
+
+    assert client.get(f"/chats/{chat.id}", headers=auth_headers(user)).status_code == 200
+    sink.flush()
+
+    records = [orjson.loads(line) for line in b"".join(written).splitlines()]
+    assert records
+    assert {record["route"] for record in records} == {"/chats/{chat_id}"}
+
+
+def test_background_sink_writes_without_flush():
+    written = []
+    sink = querylog.BufferedSink(written.append, maxsize=2, interval=60)
+
+    sink.emit({"statement": "SELECT ?"})  # half full wakes the writer
+    deadline = time.monotonic() + 2
+    while not written and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert written == [b'{"statement":"SELECT ?"}\n']
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from backend import ratelimit
+from backend.entities import ChatInDB, UserInDB
+from backend.ratelimit import MemoryStore, RateLimitStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_store_refills_and_evicts_idle_buckets():
+    clock = FakeClock()
+    store = MemoryStore(maxsize=2, idle_ttl=60, clock=clock)
+    take = lambda key: asyncio.run(store.take(key, capacity=2, refill_per_second=0.5))
+
+    assert take("a").remaining == 1
+    assert take("a").allowed
+    refused = take("a")
+    assert not refused.allowed
+    assert refused.retry_after == 2
+    assert refused.reset_after == 4
+
+    clock.now = 2
+    assert take("a").allowed
+
+    take("b")
+    take("c")
+    assert len(store) == 2  # bounded: "a" was least recently used
+
+    clock.now = 100
+    take("d")
+    assert len(store) == 1  # "b" and "c" sat idle past idle_ttl
+
+
+def test_stores_must_implement_take():
+    class HalfStore(RateLimitStore):
+        pass
+
+    with pytest.raises(TypeError):
+        HalfStore()
+
+
+def test_write_routes_return_429_with_headers(client, session, auth_headers, monkeypatch):
+    monkeypatch.setattr(ratelimit.post_message_limit, "capacity", 2)
+    user = UserInDB(username="spammer", email="spammer@example.com", hashed_password="x")
+    chat = ChatInDB(name="chat", owner=user, users=[user])
+    session.add(chat)
+    session.commit()
+    chat_id = chat.id
+    headers = auth_headers(user)
+
+    response = client.post(f"/chats/{chat_id}/messages", json={"text": "one"}, headers=headers)
+    assert response.status_code == 201
+    assert response.headers["ratelimit-limit"] == "2"
+    assert response.headers["ratelimit-remaining"] == "1"
+    client.post(f"/chats/{chat_id}/messages", json={"text": "two"}, headers=headers)
+
+    response = client.post(f"/chats/{chat_id}/messages", json={"text": "three"}, headers=headers)
+    assert response.status_code == 429
+    assert response.json()["detail"]["error"] == "rate_limited"
+    assert int(response.headers["retry-after"]) >= 1
+    assert response.headers["ratelimit-remaining"] == "0"
+
+    # buckets are per route
+    assert client.put("/users/me", json={"username": "calm"}, headers=headers).status_code == 200
@@ -1,5 +1,13 @@
+from datetime import datetime, timedelta
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine, select
+from starlette.websockets import WebSocketDisconnect
 
+from backend import database as db
+from backend.entities import ChatInDB, MessageInDB, NewMessage, UserInDB
 from backend.main import app
 
 def test_get_all_chats():
@@ -274,4 +282,587 @@ def test_get_users_in_invalid_chat():
                 "entity_name": "Chat",
                 "entity_id": "55",
             },
-        }
\ No newline at end of file
+        }
+
+def _create_chat(session, message_count=0):
+    owner = UserInDB(username="owner", email="owner@example.com", hashed_password="x")
+    outsider = UserInDB(username="outsider", email="outsider@example.com", hashed_password="x")
+    chat = ChatInDB(name="chat", owner=owner, users=[owner])
+    session.add_all([owner, outsider, chat])
+    session.commit()
+
+    start = datetime(2024, 1, 1)
+    for i in range(message_count):
+        session.add(MessageInDB(
+            text=f"message {i}",
+            user_id=owner.id,
+            chat_id=chat.id,
+            created_at=start + timedelta(minutes=i),
+        ))
+    session.commit()
+    return chat, owner, outsider
+
+
+def test_get_messages_pages_newest_first(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session, message_count=5)
+    headers = auth_headers(owner)
+
+    response = client.get(f"/chats/{chat.id}/messages?limit=2", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == ["message 3", "message 4"]
+    assert body["meta"]["count"] == 2
+    assert body["meta"]["next_cursor"] is None
+    assert body["meta"]["prev_cursor"] is not None
+
+    texts = [m["text"] for m in body["messages"]]
+    cursor = body["meta"]["prev_cursor"]
+    while cursor:
+        response = client.get(
+            f"/chats/{chat.id}/messages", params={"limit": 2, "before": cursor}, headers=headers,
+        )
+        body = response.json()
+        texts = [m["text"] for m in body["messages"]] + texts
+        cursor = body["meta"]["prev_cursor"]
+    assert texts == [f"message {i}" for i in range(5)]
+
+
+def test_get_messages_after_cursor_and_at_timestamp(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session, message_count=5)
+    headers = auth_headers(owner)
+
+    response = client.get(
+        f"/chats/{chat.id}/messages", params={"limit": 2, "at": "2024-01-01T00:01:00"}, headers=headers,
+    )
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == ["message 1", "message 2"]
+    assert body["meta"]["prev_cursor"] is not None
+
+    response = client.get(
+        f"/chats/{chat.id}/messages",
+        params={"limit": 2, "after": body["meta"]["next_cursor"]},
+        headers=headers,
+    )
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == ["message 3", "message 4"]
+    assert body["meta"]["next_cursor"] is None
+
+
+def test_get_messages_invalid_pagination(client, session, auth_headers):
+    chat, owner, outsider = _create_chat(session, message_count=1)
+
+    response = client.get(f"/chats/{chat.id}/messages?before=garbage", headers=auth_headers(owner))
+    assert response.status_code == 422
+    assert response.json()["detail"]["type"] == "invalid_cursor"
+
+    response = client.get(f"/chats/{chat.id}/messages", headers=auth_headers(outsider))
+    assert response.status_code == 403
+
+
+def test_chat_socket_pushes_message_events(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session)
+    headers = auth_headers(owner)
+    token = headers["Authorization"].split()[1]
+
+    with client.websocket_connect(f"/chats/{chat.id}/ws?token={token}") as websocket:
+        response = client.post(f"/chats/{chat.id}/messages", json={"text": "hello"}, headers=headers)
+        assert response.status_code == 201
+        message_id = response.json()["message"]["id"]
+        event = websocket.receive_json()
+        assert event["type"] == "message_created"
+        assert event["message"]["text"] == "hello"
+
+        client.put(f"/chats/{chat.id}/messages/{message_id}", json={"text": "edited"}, headers=headers)
+        event = websocket.receive_json()
+        assert event["type"] == "message_updated"
+        assert event["message"]["text"] == "edited"
+
+        client.delete(f"/chats/{chat.id}/messages/{message_id}", headers=headers)
+        assert websocket.receive_json() == {"type": "message_deleted", "message_id": message_id}
+
+
+def test_chat_socket_only_gets_its_own_chats_events(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session)
+    other = ChatInDB(name="other", owner=owner, users=[owner])
+    session.add(other)
+    session.commit()
+    chat_id, other_id = chat.id, other.id
+    headers = auth_headers(owner)
+    token = headers["Authorization"].split()[1]
+    message_id = client.post(
+        f"/chats/{other_id}/messages", json={"text": "elsewhere"}, headers=headers,
+    ).json()["message"]["id"]
+
+    with client.websocket_connect(f"/chats/{chat_id}/ws?token={token}") as websocket:
+        client.put(f"/chats/{chat_id}/messages/{message_id}", json={"text": "edited"}, headers=headers)
+        client.delete(f"/chats/{chat_id}/messages/{message_id}", headers=headers)
+        client.post(f"/chats/{chat_id}/messages", json={"text": "here"}, headers=headers)
+        # the first event is for this chat's own message
+        assert websocket.receive_json()["message"]["text"] == "here"
+
+
+def test_chat_socket_rejects_non_members(client, session, auth_headers):
+    chat, _, outsider = _create_chat(session)
+    token = auth_headers(outsider)["Authorization"].split()[1]
+
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect(f"/chats/{chat.id}/ws?token={token}"):
+            pass
+    assert error.value.code == 1008
+
+
+def test_get_changes_since_version(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session)
+    headers = auth_headers(owner)
+
+    response = client.get(f"/chats/{chat.id}/changes", headers=headers)
+    assert response.json() == {
+        "meta": {"count": 0, "version": 0, "has_more": False},
+        "changes": [],
+    }
+
+    ids = [
+        client.post(f"/chats/{chat.id}/messages", json={"text": text}, headers=headers).json()["message"]["id"]
+        for text in ("one", "two", "three")
+    ]
+    version = client.get(f"/chats/{chat.id}/changes", headers=headers).json()["meta"]["version"]
+
+    client.put(f"/chats/{chat.id}/messages/{ids[0]}", json={"text": "uno"}, headers=headers)
+    client.put(f"/chats/{chat.id}/messages/{ids[0]}", json={"text": "eins"}, headers=headers)
+    client.delete(f"/chats/{chat.id}/messages/{ids[1]}", headers=headers)
+
+    response = client.get(f"/chats/{chat.id}/changes?since={version}", headers=headers)
+    body = response.json()
+    assert body["meta"]["count"] == 2
+    assert body["meta"]["version"] > version
+    assert [(c["type"], c["message_id"]) for c in body["changes"]] == [
+        ("updated", ids[0]),
+        ("deleted", ids[1]),
+    ]
+    assert body["changes"][0]["message"]["text"] == "eins"
+    assert body["changes"][1]["message"] is None
+
+    response = client.get(f"/chats/{chat.id}/changes?since={body['meta']['version']}", headers=headers)
+    assert response.json()["meta"]["count"] == 0
+
+
+def test_change_versions_follow_each_chat(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session)
+    other = ChatInDB(name="other", owner=owner, users=[owner])
+    session.add(other)
+    session.commit()
+    chat_id, other_id = chat.id, other.id
+    headers = auth_headers(owner)
+
+    client.post(f"/chats/{other_id}/messages", json={"text": "elsewhere"}, headers=headers)
+    message_id = client.post(f"/chats/{chat_id}/messages", json={"text": "one"}, headers=headers).json()["message"]["id"]
+    client.post(f"/chats/{chat_id}/messages:batch", json={"messages": [{"text": "two"}, {"text": "three"}]}, headers=headers)
+    client.put(f"/chats/{chat_id}/messages/{message_id}", json={"text": "uno"}, headers=headers)
+
+    # versions are the chat's own sequence, assigned under its row lock
+    body = client.get(f"/chats/{chat_id}/changes", headers=headers).json()
+    versions = [c["version"] for c in body["changes"]]
+    assert [c["type"] for c in body["changes"]] == ["created", "created", "updated"]
+    assert versions == list(range(versions[0], versions[0] + 3))
+    assert body["meta"]["version"] == versions[-1]
+    assert client.get(f"/chats/{chat_id}/changes?since={versions[0]}", headers=headers).json()["meta"]["count"] == 2
+    other_version = client.get(f"/chats/{other_id}/changes", headers=headers).json()["meta"]["version"]
+    assert other_version == session.get(ChatInDB, other_id).version
+
+
+def test_messages_cannot_be_changed_through_another_chat(client, session, auth_headers):
+    chat, owner, outsider = _create_chat(session)
+    chat.users.append(outsider)
+    private = ChatInDB(name="private", owner=owner, users=[owner])
+    session.add(private)
+    session.commit()
+    chat_id, private_id = chat.id, private.id
+    headers = auth_headers(owner)
+    message_id = client.post(
+        f"/chats/{private_id}/messages", json={"text": "private"}, headers=headers,
+    ).json()["message"]["id"]
+
+    response = client.put(f"/chats/{chat_id}/messages/{message_id}", json={"text": "leaked"}, headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"]["entity_name"] == "Message"
+    assert client.delete(f"/chats/{chat_id}/messages/{message_id}", headers=headers).status_code == 404
+
+    response = client.get(f"/chats/{chat_id}/changes", headers=auth_headers(outsider))
+    assert response.json()["changes"] == []
+    messages = client.get(f"/chats/{private_id}/messages", headers=headers).json()["messages"]
+    assert [message["text"] for message in messages] == ["private"]
+
+
+@pytest.mark.parametrize("message_count, archive_queries", [(3, 1), (60, 0)])
+def test_get_messages_query_count(client, session, auth_headers, count_queries, message_count, archive_queries):
+    chat, owner, _ = _create_chat(session, message_count=message_count)
+    other = UserInDB(username="other", email="other@example.com", hashed_password="x")
+    session.add(other)
+    session.commit()
+    for i in range(message_count):
+        session.add(MessageInDB(text=f"reply {i}", user_id=other.id, chat_id=chat.id))
+    session.commit()
+    chat_id = chat.id
+    headers = auth_headers(owner)
+
+    with count_queries() as statements:
+        response = client.get(f"/chats/{chat_id}/messages?limit=100", headers=headers)
+    assert response.status_code == 200
+    # current user, membership, ETag versions, chat with owner, message page
+    # with authors joined, and the archive only when the hot table can't fill the page
+    assert len(statements) == 5 + archive_queries
+
+
+@pytest.mark.parametrize("chat_count", [1, 20])
+def test_get_chats_query_count(client, session, auth_headers, count_queries, chat_count):
+    user = UserInDB(username="member", email="member@example.com", hashed_password="x")
+    session.add(user)
+    for i in range(chat_count):
+        owner = UserInDB(username=f"owner{i}", email=f"owner{i}@example.com", hashed_password="x")
+        session.add(ChatInDB(name=f"chat {i}", owner=owner, users=[owner, user]))
+    session.commit()
+    headers = auth_headers(user)
+
+    with count_queries() as statements:
+        response = client.get("/chats", headers=headers)
+    assert response.json()["meta"]["count"] == chat_count
+    # current user, user lookup, chats with owners joined
+    assert len(statements) == 3
+
+
+def test_unread_counts_and_read_receipts(client, session, auth_headers):
+    chat, owner, outsider = _create_chat(session)
+    reader = UserInDB(username="reader", email="reader@example.com", hashed_password="x")
+    chat.users.append(reader)
+    session.add(reader)
+    session.commit()
+    chat_id = chat.id
+    owner_headers, reader_headers = auth_headers(owner), auth_headers(reader)
+
+    ids = [
+        client.post(f"/chats/{chat_id}/messages", json={"text": text}, headers=owner_headers).json()["message"]["id"]
+        for text in ("one", "two", "three")
+    ]
+
+    def unread(headers):
+        return client.get("/chats", headers=headers).json()["chats"][0]["unread_count"]
+
+    assert unread(reader_headers) == 3
+    assert unread(owner_headers) == 0
+
+    response = client.post(f"/chats/{chat_id}/read", json={"message_id": ids[0]}, headers=reader_headers)
+    assert response.status_code == 200
+    assert response.json()["unread_count"] == 2
+    assert response.json()["last_read_message_id"] == ids[0]
+
+    client.delete(f"/chats/{chat_id}/messages/{ids[2]}", headers=owner_headers)
+    assert unread(reader_headers) == 1
+
+    response = client.post(f"/chats/{chat_id}/read", headers=reader_headers)
+    assert response.json()["unread_count"] == 0
+    assert response.json()["last_read_message_id"] == ids[1]
+    assert unread(reader_headers) == 0
+
+    response = client.post(f"/chats/{chat_id}/read", headers=auth_headers(outsider))
+    assert response.status_code == 403
+
+
+def test_unread_counts_ignore_deletes_through_another_chat(client, session, auth_headers):
+    chat, owner, reader = _create_chat(session)
+    chat.users.append(reader)
+    other = ChatInDB(name="other", owner=owner, users=[owner, reader])
+    session.add(other)
+    session.commit()
+    chat_id, other_id = chat.id, other.id
+    owner_headers, reader_headers = auth_headers(owner), auth_headers(reader)
+
+    client.post(f"/chats/{chat_id}/messages", json={"text": "unread"}, headers=owner_headers)
+    message_id = client.post(
+        f"/chats/{other_id}/messages", json={"text": "unread"}, headers=owner_headers,
+    ).json()["message"]["id"]
+    assert client.delete(f"/chats/{chat_id}/messages/{message_id}", headers=owner_headers).status_code == 404
+
+    chats = client.get("/chats", headers=reader_headers).json()["chats"]
+    assert {chat["id"]: chat["unread_count"] for chat in chats} == {chat_id: 1, other_id: 1}
+
+
+def test_get_chat_meta_from_maintained_counters(client, session, auth_headers, count_queries):
+    chat, owner, outsider = _create_chat(session)
+    chat.users.append(outsider)
+    session.commit()
+    chat_id = chat.id
+    headers = auth_headers(owner)
+
+    ids = [
+        client.post(f"/chats/{chat_id}/messages", json={"text": text}, headers=headers).json()["message"]["id"]
+        for text in ("one", "two")
+    ]
+    client.delete(f"/chats/{chat_id}/messages/{ids[1]}", headers=headers)
+
+    with count_queries() as statements:
+        response = client.get(f"/chats/{chat_id}", headers=headers)
+    assert response.status_code == 200
+    meta = response.json()["meta"]
+    assert meta["message_count"] == 1
+    assert meta["user_count"] == 2
+    assert meta["last_message_at"] is not None
+    # ETag versions, chat with owner (current user and membership are cached); no message rows
+    assert len(statements) == 2
+
+
+def test_message_count_never_goes_negative(client, session, auth_headers):
+    # rows loaded behind the counters' back, as before a repair
+    chat, owner, _ = _create_chat(session, message_count=1)
+    chat_id = chat.id
+    message_id = session.exec(select(MessageInDB.id)).one()
+
+    response = client.delete(f"/chats/{chat_id}/messages/{message_id}", headers=auth_headers(owner))
+    assert response.status_code == 204
+    session.expire_all()
+    assert session.get(ChatInDB, chat_id).message_count == 0
+
+
+def test_repair_chat_stats(session):
+    chat, _, _ = _create_chat(session, message_count=3)
+    chat.message_count = 0
+    chat.member_count = 0
+    session.commit()
+
+    assert db.repair_chat_stats(session) == 1
+    session.refresh(chat)
+    assert chat.message_count == 3
+    assert chat.member_count == 1
+    assert chat.last_message_at == datetime(2024, 1, 1, 0, 2)
+
+
+@pytest.mark.parametrize("chat_count", [1, 20])
+def test_inbox_orders_by_activity_in_one_query(client, session, auth_headers, count_queries, chat_count):
+    owner = UserInDB(username="owner", email="owner@example.com", hashed_password="x")
+    sender = UserInDB(username="sender", email="sender@example.com", hashed_password="x")
+    chats = [
+        ChatInDB(name=f"chat {i}", owner=owner, users=[owner, sender], created_at=datetime(2024, 1, 1))
+        for i in range(chat_count)
+    ]
+    session.add_all(chats)
+    session.commit()
+    names = [chat.name for chat in chats]
+    headers = auth_headers(owner)
+    # reverse creation order, so activity disagrees with both name and id
+    for chat in reversed(chats):
+        db.add_message(session, sender, chat.id, NewMessage(text=f"latest in {chat.name}" + "!" * 200))
+    client.get("/chats/inbox", headers=headers)
+
+    with count_queries() as statements:
+        response = client.get("/chats/inbox", headers=headers)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+    entries = response.json()["chats"]
+    assert [entry["name"] for entry in entries] == names
+    assert entries[0]["unread_count"] == 1
+    assert entries[0]["last_message"]["user"]["username"] == "sender"
+    assert entries[0]["last_message"]["text"].startswith("latest in chat 0")
+    assert len(entries[0]["last_message"]["text"]) == 140
+
+
+def test_inbox_pages_with_cursor(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session, message_count=1)
+    quiet = ChatInDB(name="quiet", owner=owner, users=[owner], created_at=datetime(2023, 1, 1))
+    session.add(quiet)
+    session.commit()
+    headers = auth_headers(owner)
+
+    response = client.get("/chats/inbox?limit=1", headers=headers)
+    body = response.json()
+    assert [entry["name"] for entry in body["chats"]] == ["chat"]
+    assert body["meta"]["next_cursor"] is not None
+
+    response = client.get(f"/chats/inbox?limit=1&before={body['meta']['next_cursor']}", headers=headers)
+    body = response.json()
+    assert [entry["name"] for entry in body["chats"]] == ["quiet"]
+    assert body["chats"][0]["last_message"] is None
+    assert body["chats"][0]["last_activity_at"] == "2023-01-01T00:00:00"
+    assert body["meta"]["next_cursor"] is None
+
+
+def test_post_message_batch(client, session, auth_headers, count_queries):
+    chat, owner, outsider = _create_chat(session)
+    reader = UserInDB(username="reader", email="reader@example.com", hashed_password="x")
+    chat.users.append(reader)
+    session.commit()
+    chat_id = chat.id
+    headers, reader_headers, outsider_headers = auth_headers(owner), auth_headers(reader), auth_headers(outsider)
+    batch = {"messages": [{"text": f"bulk {i}"} for i in range(5)]}
+
+    client.get("/chats", headers=headers)  # warm the user cache
+    with count_queries() as statements:
+        response = client.post(f"/chats/{chat_id}/messages:batch", json=batch, headers=headers)
+    assert response.status_code == 201
+    created = response.json()["messages"]
+    assert response.json()["meta"]["count"] == 5
+    assert created == sorted(created, key=lambda message: message["id"])
+    # membership, message insert, stats update, change log insert, unread update
+    assert len(statements) == 5
+
+    texts = [m["text"] for m in client.get(f"/chats/{chat_id}/messages", headers=headers).json()["messages"]]
+    assert texts == [f"bulk {i}" for i in range(5)]
+    assert client.get(f"/chats/{chat_id}", headers=headers).json()["meta"]["message_count"] == 5
+    assert client.get("/chats", headers=reader_headers).json()["chats"][0]["unread_count"] == 5
+
+    response = client.post(f"/chats/{chat_id}/messages:batch", json=batch, headers=outsider_headers)
+    assert response.status_code == 403
+    response = client.post(f"/chats/{chat_id}/messages:batch", json={"messages": []}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_archived_messages_are_read_through(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session, message_count=6)
+    chat_id = chat.id
+    headers = auth_headers(owner)
+
+    assert db.archive_messages(session, datetime(2024, 1, 1, 0, 4), batch_size=3) == 4
+    assert session.exec(select(MessageInDB)).all()[0].text == "message 4"
+
+    response = client.get(f"/chats/{chat_id}/messages?limit=4", headers=headers)
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == [f"message {i}" for i in range(2, 6)]
+    response = client.get(f"/chats/{chat_id}/messages?limit=4&before={body['meta']['prev_cursor']}", headers=headers)
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == ["message 0", "message 1"]
+    assert body["meta"]["prev_cursor"] is None
+
+    response = client.get(f"/chats/{chat_id}/messages?limit=3&at=2024-01-01T00:03:00", headers=headers)
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == ["message 3", "message 4", "message 5"]
+    assert body["meta"]["prev_cursor"] is not None
+
+    # _create_chat bypasses the counters, so the repair has to count both tiers
+    assert db.repair_chat_stats(session) == 1
+    meta = client.get(f"/chats/{chat_id}", headers=headers).json()["meta"]
+    assert meta["message_count"] == 6
+
+    db.archive_messages(session, datetime(2025, 1, 1), batch_size=3)
+    entry = client.get("/chats/inbox", headers=headers).json()["chats"][0]
+    assert entry["last_message"]["text"] == "message 5"
+
+
+def test_archiving_never_frees_message_ids(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session, message_count=3)
+    chat_id = chat.id
+    headers = auth_headers(owner)
+
+    assert db.archive_messages(session, datetime(2025, 1, 1), batch_size=10) == 3
+    response = client.post(f"/chats/{chat_id}/messages", json={"text": "after"}, headers=headers)
+    assert response.json()["message"]["id"] == 4
+    assert db.archive_messages(session, datetime.now() + timedelta(days=1), batch_size=10) == 1
+
+
+def test_archived_messages_can_be_searched_edited_and_deleted(client, session, auth_headers):
+    chat, owner, _ = _create_chat(session)
+    chat_id = chat.id
+    headers = auth_headers(owner)
+    ids = [
+        client.post(f"/chats/{chat_id}/messages", json={"text": text}, headers=headers).json()["message"]["id"]
+        for text in ("old rocket", "old lunch")
+    ]
+    db.archive_messages(session, datetime.now() + timedelta(days=1), batch_size=10)
+    client.post(f"/chats/{chat_id}/messages", json={"text": "new rocket"}, headers=headers)
+
+    def search(query):
+        body = client.get(f"/chats/{chat_id}/messages/search?q={query}", headers=headers).json()
+        return sorted(m["text"] for m in body["messages"])
+
+    assert search("rocket") == ["new rocket", "old rocket"]
+
+    response = client.put(f"/chats/{chat_id}/messages/{ids[0]}", json={"text": "old comet"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["message"]["text"] == "old comet"
+    assert search("rocket") == ["new rocket"]
+    assert search("comet") == ["old comet"]
+
+    response = client.post(f"/chats/{chat_id}/read", json={"message_id": ids[1]}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["unread_count"] == 1
+
+    assert client.delete(f"/chats/{chat_id}/messages/{ids[0]}", headers=headers).status_code == 204
+    assert search("comet") == []
+    assert client.get(f"/chats/{chat_id}", headers=headers).json()["meta"]["message_count"] == 2
+
+
+def test_create_db_and_tables_stops_message_id_reuse(tmp_path, monkeypatch):
+    # a messages table from before AUTOINCREMENT, with its newest messages archived
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE messages"))
+        connection.execute(text(
+            "CREATE TABLE messages (id INTEGER NOT NULL PRIMARY KEY, text VARCHAR NOT NULL, "
+            "user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, created_at DATETIME)"
+        ))
+        connection.execute(text("INSERT INTO messages VALUES (1, 'hot rocket', 1, 1, '2024-01-01 00:00:00')"))
+        connection.execute(text("INSERT INTO archived_messages VALUES (2, 'old', 1, 1, '2024-01-01 00:00:00')"))
+    monkeypatch.setattr(db, "_engine", engine)
+
+    db.create_db_and_tables()
+    with Session(engine) as session:
+        session.add(MessageInDB(text="new", user_id=1, chat_id=1))
+        session.commit()
+        assert session.exec(select(MessageInDB.id).order_by(MessageInDB.id)).all() == [1, 3]
+    with engine.connect() as connection:
+        # indexed once, by the rebuilt table's triggers
+        assert connection.scalar(text("SELECT count(*) FROM messages_fts WHERE messages_fts MATCH 'rocket'")) == 1
+    engine.dispose()
+
+
+def test_conditional_get_on_messages(client, session, auth_headers, count_queries):
+    chat, owner, outsider = _create_chat(session, message_count=3)
+    chat_id = chat.id
+    headers, outsider_headers = auth_headers(owner), auth_headers(outsider)
+
+    response = client.get(f"/chats/{chat_id}/messages", headers=headers)
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    with count_queries() as statements:
+        response = client.get(f"/chats/{chat_id}/messages", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert len(statements) == 1
+
+    response = client.get(f"/chats/{chat_id}/messages", headers={**outsider_headers, "If-None-Match": etag})
+    assert response.status_code == 403
+    response = client.get(f"/chats/{chat_id}/messages?limit=2", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+    client.post(f"/chats/{chat_id}/messages", json={"text": "new"}, headers=headers)
+    response = client.get(f"/chats/{chat_id}/messages", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    etag = response.headers["etag"]
+    client.put("/users/me", json={"username": "renamed"}, headers=headers)
+    response = client.get(f"/chats/{chat_id}/messages", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_membership_check_is_cached_and_invalidated(client, session, auth_headers, count_queries):
+    chat, owner, outsider = _create_chat(session)
+    member = UserInDB(username="member", email="member@example.com", hashed_password="x")
+    chat.users.append(member)
+    session.commit()
+    chat_id = chat.id
+    member_headers, outsider_headers = auth_headers(member), auth_headers(outsider)
+
+    assert client.get(f"/chats/{chat_id}/users", headers=member_headers).status_code == 200
+    with count_queries() as statements:
+        assert client.get(f"/chats/{chat_id}/users", headers=member_headers).status_code == 200
+    # chat and members; the current user and membership come from their caches
+    assert len(statements) == 2
+
+    assert client.get(f"/chats/{chat_id}/users", headers=outsider_headers).status_code == 403
+    assert client.get("/chats/999999/users", headers=outsider_headers).status_code == 404
+
+    chat = session.get(ChatInDB, chat_id)
+    chat.users.remove(session.get(UserInDB, member.id))
+    session.commit()
+    assert client.get(f"/chats/{chat_id}/users", headers=member_headers).status_code == 403
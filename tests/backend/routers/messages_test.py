@@ -0,0 +1,61 @@
+from backend.entities import ChatInDB, UserInDB
+
+
+def _create_chats(session):
+    member = UserInDB(username="member", email="member@example.com", hashed_password="x")
+    other = UserInDB(username="other", email="other@example.com", hashed_password="x")
+    mine = ChatInDB(name="mine", owner=member, users=[member])
+    theirs = ChatInDB(name="theirs", owner=other, users=[other])
+    session.add_all([member, other, mine, theirs])
+    session.commit()
+    return member, other, mine, theirs
+
+
+def test_search_messages_in_chat(client, session, auth_headers):
+    member, _, mine, _ = _create_chats(session)
+    headers = auth_headers(member)
+    for text in ("the rocket launched", "lunch at noon", "rocket rocket rocket"):
+        client.post(f"/chats/{mine.id}/messages", json={"text": text}, headers=headers)
+
+    response = client.get(f"/chats/{mine.id}/messages/search?q=rocket", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [m["text"] for m in body["messages"]] == ["rocket rocket rocket", "the rocket launched"]
+    assert body["meta"] == {"count": 2, "next_offset": None}
+
+    response = client.get(f"/chats/{mine.id}/messages/search?q=rocket&limit=1", headers=headers)
+    assert response.json()["meta"]["next_offset"] == 1
+
+
+def test_search_index_follows_edits_and_deletes(client, session, auth_headers):
+    member, _, mine, _ = _create_chats(session)
+    headers = auth_headers(member)
+    message_id = client.post(
+        f"/chats/{mine.id}/messages", json={"text": "draft"}, headers=headers,
+    ).json()["message"]["id"]
+
+    client.put(f"/chats/{mine.id}/messages/{message_id}", json={"text": "final"}, headers=headers)
+    assert client.get(f"/chats/{mine.id}/messages/search?q=draft", headers=headers).json()["messages"] == []
+    assert client.get(f"/chats/{mine.id}/messages/search?q=final", headers=headers).json()["meta"]["count"] == 1
+
+    client.delete(f"/chats/{mine.id}/messages/{message_id}", headers=headers)
+    assert client.get(f"/chats/{mine.id}/messages/search?q=final", headers=headers).json()["messages"] == []
+
+
+def test_search_across_own_chats_only(client, session, auth_headers):
+    member, other, mine, theirs = _create_chats(session)
+    client.post(f"/chats/{mine.id}/messages", json={"text": "secret plan"}, headers=auth_headers(member))
+    client.post(f"/chats/{theirs.id}/messages", json={"text": "secret plan"}, headers=auth_headers(other))
+
+    response = client.get('/messages/search?q="secret', headers=auth_headers(member))
+    assert response.status_code == 200
+    assert [m["chat_id"] for m in response.json()["messages"]] == [mine.id]
+
+
+def test_search_rejects_blank_queries(client, session, auth_headers):
+    member, _, mine, _ = _create_chats(session)
+    headers = auth_headers(member)
+
+    for url in (f"/chats/{mine.id}/messages/search", "/messages/search"):
+        for query in ("", "%20%20%20", "%09"):
+            assert client.get(f"{url}?q={query}", headers=headers).status_code == 422
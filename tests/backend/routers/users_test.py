@@ -1,5 +1,8 @@
+import pytest
 from fastapi.testclient import TestClient
 
+from backend.cache import user_cache
+from backend.entities import ChatInDB, UserInDB
 from backend.main import app
 
 
@@ -101,3 +104,59 @@ def test_get_invalid_user_chats():
             },
         }
 
+
+
+@pytest.mark.parametrize("chat_count", [1, 20])
+def test_get_user_chats_query_count(client, session, count_queries, chat_count):
+    user = UserInDB(username="member", email="member@example.com", hashed_password="x")
+    session.add(user)
+    for i in range(chat_count):
+        owner = UserInDB(username=f"owner{i}", email=f"owner{i}@example.com", hashed_password="x")
+        session.add(ChatInDB(name=f"chat {i}", owner=owner, users=[owner, user]))
+    session.commit()
+    user_id = user.id
+
+    with count_queries() as statements:
+        response = client.get(f"/users/{user_id}/chats")
+    assert response.json()["meta"]["count"] == chat_count
+    # user lookup, chats with owners joined
+    assert len(statements) == 2
+
+
+def test_current_user_is_cached_until_updated(client, session, auth_headers, count_queries):
+    user = UserInDB(username="cached", email="cached@example.com", hashed_password="x")
+    session.add(user)
+    session.commit()
+    headers = auth_headers(user)
+
+    with count_queries() as statements:
+        assert client.get("/users/me", headers=headers).status_code == 200
+    assert len(statements) == 1
+    with count_queries() as statements:
+        assert client.get("/users/me", headers=headers).json()["user"]["username"] == "cached"
+    assert len(statements) == 0
+    assert user_cache.stats()["hits"] == 1
+
+    client.put("/users/me", json={"username": "renamed"}, headers=headers)
+    response = client.get("/users/me", headers=headers)
+    assert response.json()["user"]["username"] == "renamed"
+
+
+def test_conditional_get_on_users(client, session, auth_headers):
+    user = UserInDB(username="polled", email="polled@example.com", hashed_password="x")
+    session.add(user)
+    session.commit()
+    user_id = user.id
+    headers = auth_headers(user)
+
+    etag = client.get(f"/users/{user_id}").headers["etag"]
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    list_etag = client.get("/users").headers["etag"]
+    assert client.get("/users", headers={"If-None-Match": list_etag}).status_code == 304
+
+    client.put("/users/me", json={"username": "renamed"}, headers=headers)
+    response = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["user"]["username"] == "renamed"
+    assert client.get("/users", headers={"If-None-Match": list_etag}).status_code == 200
@@ -0,0 +1,27 @@
+import json
+from datetime import datetime
+
+from backend.entities import ChatInDB, MessageInDB, MsgCollection, UserChatCollection, UserInDB
+from backend.serialization import RowSerializer, render
+
+
+def _rows():
+    author = UserInDB(id=1, username="author", email="author@example.com", hashed_password="x",
+                      created_at=datetime(2024, 1, 1, 12, 30, 15, 123456))
+    chat = ChatInDB(id=2, name="chat", owner=author, created_at=datetime(2024, 1, 2))
+    messages = [
+        MessageInDB(id=i, text=f"message {i}", chat_id=2, user=author, created_at=datetime(2024, 1, 3, 0, i))
+        for i in range(3)
+    ]
+    return chat, messages
+
+
+def test_fast_path_matches_response_models():
+    chat, messages = _rows()
+    rows = RowSerializer()
+
+    body = {"meta": {"count": 3, "prev_cursor": "p", "next_cursor": None}, "messages": [rows.message(m) for m in messages]}
+    assert json.loads(render(body).body) == MsgCollection.model_validate(body).model_dump(mode="json")
+
+    body = {"meta": {"count": 1}, "chats": [rows.chat(chat, unread_count=4)]}
+    assert json.loads(render(body).body) == UserChatCollection.model_validate(body).model_dump(mode="json")
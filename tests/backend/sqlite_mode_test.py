@@ -0,0 +1,103 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, func, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend import sqlite_mode
+from backend.entities import UserInDB
+
+
+def build_engines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'concurrent.db'}"
+    reader = create_engine(url, connect_args={"check_same_thread": False})
+    writer = create_engine(url, connect_args={"check_same_thread": False}, **sqlite_mode.writer_pool_options())
+    for engine in (reader, writer):
+        sqlite_mode.apply_pragmas(engine)
+    SQLModel.metadata.create_all(writer)
+    return reader, writer
+
+
+def record_statements(engine, name: str, log: list):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(_conn, _cursor, statement, _parameters, _context, _executemany):
+        log.append((name, statement.split()[0]))
+
+
+def test_connections_use_wal_and_pragmas(tmp_path):
+    reader, writer = build_engines(tmp_path)
+    with reader.connect() as connection:
+        assert connection.scalar(text("PRAGMA journal_mode")) == "wal"
+        assert connection.scalar(text("PRAGMA synchronous")) == 1  # NORMAL
+        assert connection.scalar(text("PRAGMA busy_timeout")) == sqlite_mode.busy_timeout
+    assert writer.pool.size() == 1
+    reader.dispose()
+    writer.dispose()
+
+
+def test_routing_session_sends_writes_and_their_transaction_to_the_writer(tmp_path):
+    reader, writer = build_engines(tmp_path)
+    log = []
+    record_statements(reader, "reader", log)
+    record_statements(writer, "writer", log)
+
+    with sqlite_mode.RoutingSession(reader, writer=writer) as session:
+        assert session.exec(select(UserInDB)).all() == []
+        session.add(UserInDB(username="writer", email="writer@example.com", hashed_password="x"))
+        session.flush()
+        # uncommitted, so only visible on the writer's connection
+        assert session.exec(select(func.count(UserInDB.id))).one() == 1
+        session.commit()
+        assert session.exec(select(func.count(UserInDB.id))).one() == 1
+
+    assert log == [("reader", "SELECT"), ("writer", "INSERT"), ("writer", "SELECT"), ("reader", "SELECT")]
+    reader.dispose()
+    writer.dispose()
+
+
+def test_concurrent_writers_queue_for_the_writer(tmp_path):
+    reader, writer = build_engines(tmp_path)
+
+    def register(index: int):
+        with sqlite_mode.RoutingSession(reader, writer=writer) as session:
+            session.add(UserInDB(username=f"user{index}", email=f"user{index}@example.com", hashed_password="x"))
+            session.commit()
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(register, range(200)))
+
+    with sqlite_mode.RoutingSession(reader, writer=writer) as session:
+        assert session.exec(select(func.count(UserInDB.id))).one() == 200
+    reader.dispose()
+    writer.dispose()
+
+
+def test_async_sessions_route_writes_to_the_writer(tmp_path):
+    for engine in build_engines(tmp_path):
+        engine.dispose()
+    url = f"sqlite+aiosqlite:///{tmp_path / 'concurrent.db'}"
+    reader = create_async_engine(url)
+    writer = create_async_engine(url, **sqlite_mode.writer_pool_options(is_async=True))
+    log = []
+    record_statements(reader.sync_engine, "reader", log)
+    record_statements(writer.sync_engine, "writer", log)
+
+    async def register_and_count(index: int) -> int:
+        async with AsyncSession(
+            reader, sync_session_class=sqlite_mode.RoutingSession, writer=writer.sync_engine
+        ) as session:
+            session.add(UserInDB(username=f"user{index}", email=f"user{index}@example.com", hashed_password="x"))
+            await session.commit()
+            return len((await session.exec(select(UserInDB))).all())
+
+    async def main():
+        counts = await asyncio.gather(*(register_and_count(index) for index in range(20)))
+        await reader.dispose()
+        await writer.dispose()
+        return counts
+
+    assert max(asyncio.run(main())) == 20
+    assert {name for name, statement in log if statement == "INSERT"} == {"writer"}
+    assert {name for name, statement in log if statement == "SELECT"} == {"reader"}
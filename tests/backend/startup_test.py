@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# run in a fresh interpreter: this test session has long since imported
+# everything and created the engines
+check_cold_import = """
+import sys
+import backend.main
+from backend import async_database, database
+
+assert database._engine is None and database._writer_engine is None
+assert async_database._async_engine is None and async_database._async_writer_engine is None
+assert "jose.jwt" not in sys.modules
+"""
+
+
+def test_importing_the_app_stays_cheap():
+    result = subprocess.run(
+        [sys.executable, "-c", check_cold_import],
+        cwd=Path(__file__).parents[2], capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
@@ -1,30 +1,113 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
 import pytest
+
+# tests that use the app's own database get a copy, so running them never
+# changes the committed backend/pony_express.db
+_workdir = tempfile.mkdtemp(prefix="pony-express-tests-")
+shutil.copy("backend/pony_express.db", os.path.join(_workdir, "pony_express.db"))
+os.environ.setdefault("SQLITE_PATH", os.path.join(_workdir, "pony_express.db"))
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, StaticPool, create_engine
+from sqlalchemy import NullPool, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from backend.main import app
+from backend import async_database as adb
+from backend import auth
 from backend import database as db
+from backend import ratelimit
+from backend.cache import membership_cache, user_cache
+
+
+@pytest.fixture(scope="session", autouse=True)
+def app_database():
+    # as at startup: bring the copy up to the current schema
+    db.create_db_and_tables()
+    yield
+    shutil.rmtree(_workdir, ignore_errors=True)
 
 
 @pytest.fixture
-def session():
+def engine(tmp_path):
+    # a file, so the sync and async engines see the same database
     engine = create_engine(
-        "sqlite://",
+        f"sqlite:///{tmp_path / 'test.db'}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
     SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_engine(engine):
+    return create_async_engine(
+        engine.url.set(drivername="sqlite+aiosqlite"),
+        poolclass=NullPool,
+    )
+
+
+@pytest.fixture
+def session(engine):
     with Session(engine) as session:
         yield session
 
 
 @pytest.fixture
-def client(session):
+def client(session, async_engine, monkeypatch):
     def _get_session_override():
         return session
 
+    async def _get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[db.get_session] = _get_session_override
+    app.dependency_overrides[adb.get_session] = _get_async_session_override
+    user_cache.clear()
+    membership_cache.clear()
+    # user ids repeat across test databases; don't share buckets between tests
+    monkeypatch.setattr(ratelimit, "store", ratelimit.MemoryStore())
 
     yield TestClient(app)
 
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def auth_headers():
+    def _auth_headers(user):
+        token = auth._build_access_token(user).access_token
+        return {"Authorization": f"Bearer {token}"}
+
+    return _auth_headers
+
+
+@pytest.fixture
+def count_queries(session, engine, async_engine):
+    """Context manager collecting the SQL statements run against the test engines."""
+
+    @contextmanager
+    def _count_queries():
+        # start from a cold identity map, as a fresh request session would
+        session.expunge_all()
+        statements = []
+
+        def _record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        engines = [engine, async_engine.sync_engine]
+        for target in engines:
+            event.listen(target, "before_cursor_execute", _record)
+        try:
+            yield statements
+        finally:
+            for target in engines:
+                event.remove(target, "before_cursor_execute", _record)
+
+    return _count_queries